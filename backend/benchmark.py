@@ -0,0 +1,487 @@
+"""
+Load and benchmark suite that runs the API in-process against the in-memory
+storage backend and a stub LLM, so no Astra cluster or Gemini key is needed.
+
+    cd backend
+    python benchmark.py --posts 2000 --requests 200 --concurrency 8
+
+Each workload reports throughput and p50/p95/p99 latency. Use --json to write
+the results to a file and compare runs.
+
+    python benchmark.py --startup 5
+
+measures cold import time and time-to-ready over fresh interpreters instead.
+
+    python benchmark.py --representation 1000000
+
+compares memory per post and JSON serialization throughput of driver dict
+rows (the old path) against PostRecord rows rendered with orjson.
+
+    python benchmark.py --similarity 1000000
+
+measures building the content similarity index and its query latency.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Select the stand-ins before main is imported
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ.setdefault("LLM_BACKEND", "stub")
+_state_dir = tempfile.mkdtemp()
+os.environ.setdefault("PREDICTION_MODEL_PATH", os.path.join(_state_dir, "prediction_model.npz"))
+os.environ.setdefault("AGGREGATES_PATH", os.path.join(_state_dir, "shared_aggregates.bin"))
+os.environ.setdefault("SNAPSHOT_DIR", os.path.join(_state_dir, "snapshots"))
+os.environ.setdefault("SIMILARITY_INDEX_PATH", os.path.join(_state_dir, "similarity_index.npz"))
+
+POST_TYPES = ["carousel", "reel", "static"]
+WORDS = ["launch", "tips", "behind", "scenes", "update", "sale", "tutorial", "team", "story", "demo"]
+
+
+class ASGIResponse:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+async def asgi_request(app, method, path, body=b"", headers=None):
+    """Send one HTTP request straight to an ASGI app and collect the response"""
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        "client": ("127.0.0.1", 0),
+        "server": ("testserver", 80)
+    }
+    sent = False
+    finished = asyncio.Event()
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            # Streaming responses watch for a disconnect; only report it once the body is out
+            await finished.wait()
+            return {"type": "http.disconnect"}
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    status = None
+    response_headers = []
+    chunks = []
+
+    async def send(message):
+        nonlocal status, response_headers
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            response_headers = message.get("headers", [])
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                finished.set()
+
+    await app(scope, receive, send)
+    return ASGIResponse(status, response_headers, b"".join(chunks))
+
+
+class Lifespan:
+    """Drive an ASGI app's startup/shutdown events via the lifespan protocol"""
+
+    def __init__(self, app):
+        self.app = app
+        self._inbox = asyncio.Queue()
+        self._outbox = asyncio.Queue()
+        self._task = None
+
+    async def _send(self, message):
+        await self._outbox.put(message)
+
+    async def _expect(self, event):
+        message = await self._outbox.get()
+        if message["type"] != f"{event}.complete":
+            raise RuntimeError(f"{event} failed: {message.get('message', message['type'])}")
+
+    async def __aenter__(self):
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+        self._task = asyncio.create_task(self.app(scope, self._inbox.get, self._send))
+        await self._inbox.put({"type": "lifespan.startup"})
+        await self._expect("lifespan.startup")
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._inbox.put({"type": "lifespan.shutdown"})
+        await self._expect("lifespan.shutdown")
+        await self._task
+        return False
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(q * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+async def run_workload(name, app, requests, concurrency):
+    """Issue (method, path, body, headers) requests with bounded concurrency"""
+    latencies = []
+    errors = 0
+    queue = list(requests)
+    queue.reverse()
+
+    async def worker():
+        nonlocal errors
+        while queue:
+            method, path, body, headers = queue.pop()
+            start = time.perf_counter()
+            response = await asgi_request(app, method, path, body, headers)
+            latencies.append(time.perf_counter() - start)
+            if response.status >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "workload": name,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000
+    }
+
+
+def make_posts(n, rng):
+    start = datetime(2024, 1, 1)
+    posts = []
+    for i in range(n):
+        post_type = rng.choice(POST_TYPES)
+        posts.append({
+            "id": f"bench-{i}",
+            "type": post_type,
+            "likes": int(rng.lognormvariate(5, 1)),
+            "shares": int(rng.lognormvariate(3, 1)),
+            "comments": int(rng.lognormvariate(2.5, 1)),
+            "timestamp": (start + timedelta(minutes=rng.randint(0, 60 * 24 * 90))).isoformat(),
+            "content": " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12))),
+            "comment_list": ["Great post!", "Love it"] if rng.random() < 0.3 else []
+        })
+    return posts
+
+
+def json_request(method, path, payload=None):
+    body = json.dumps(payload).encode() if payload is not None else b""
+    return (method, path, body, {"content-type": "application/json"})
+
+
+def ingest_requests(n_requests, batch_size, n_posts, rng):
+    requests = []
+    for _ in range(n_requests):
+        requests.append(json_request("POST", "/engagement/events", {
+            "user_id": [f"user-{rng.randint(0, 50000)}" for _ in range(batch_size)],
+            "post_id": [f"bench-{rng.randint(0, n_posts - 1)}" for _ in range(batch_size)],
+            "engagement_type": [rng.choice(["like", "share", "comment"]) for _ in range(batch_size)]
+        }))
+    return requests
+
+
+def dashboard_requests(n_requests, rng):
+    paths = [
+        "/time-analytics",
+        "/trending-hashtags",
+        "/performance-analysis",
+    ]
+    for post_type in POST_TYPES:
+        paths.append(f"/analytics/{post_type}")
+        paths.append(f"/analytics/{post_type}/distribution")
+        paths.append(f"/insights/{post_type}")
+        paths.append(f"/dashboard?post_type={post_type}&include_figures=false")
+    return [json_request("GET", rng.choice(paths)) for _ in range(n_requests)]
+
+
+def csv_requests(n_requests, posts, rng):
+    lines = ["id,type,likes,shares,comments,timestamp,content"]
+    for post in posts[:500]:
+        lines.append(
+            f"csv-{post['id']},{post['type']},{post['likes']},{post['shares']},"
+            f"{post['comments']},{post['timestamp']},{post['content']}"
+        )
+    boundary = "benchmarkboundary"
+    body = (
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="posts.csv"\r\n'
+        "Content-Type: text/csv\r\n\r\n"
+        + "\n".join(lines)
+        + f"\r\n--{boundary}--\r\n"
+    ).encode()
+    upload = ("POST", "/import-csv", body, {"content-type": f"multipart/form-data; boundary={boundary}"})
+    export = json_request("GET", "/export-csv")
+    return [upload if rng.random() < 0.5 else export for _ in range(n_requests)]
+
+
+def visualize_requests(n_requests, rng):
+    paths = [
+        "/visualize/engagement-trends",
+        "/visualize/performance-heatmap",
+        "/visualize/content-impact"
+    ]
+    return [json_request("GET", rng.choice(paths)) for _ in range(n_requests)]
+
+
+async def wait_until_ready(app, timeout=60.0):
+    """Poll /ready until the background initialization has finished"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        response = await asgi_request(app, "GET", "/ready")
+        if response.status == 200:
+            return
+        status = json.loads(response.body)
+        if status.get("status") == "failed":
+            raise RuntimeError(f"Startup failed: {status.get('error')}")
+        await asyncio.sleep(0.005)
+    raise RuntimeError("Service did not become ready in time")
+
+
+async def startup_child():
+    """Time a cold import and startup of the app in this (fresh) interpreter"""
+    started = time.perf_counter()
+    import main as api
+    imported = time.perf_counter()
+    async with Lifespan(api.app):
+        await wait_until_ready(api.app)
+        ready = time.perf_counter()
+    print(json.dumps({"import_s": imported - started, "ready_s": ready - started}))
+
+
+def startup_benchmark(args):
+    """Run the startup child in fresh interpreters and summarize the timings"""
+    runs = []
+    for _ in range(args.startup):
+        output = subprocess.run(
+            [sys.executable, __file__, "--startup-child"],
+            check=True, capture_output=True, text=True
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    results = []
+    for key, label in (("import_s", "import"), ("ready_s", "time_to_ready")):
+        values = sorted(run[key] for run in runs)
+        results.append({
+            "workload": label,
+            "runs": len(values),
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p95_ms": percentile(values, 0.95) * 1000,
+            "max_ms": values[-1] * 1000
+        })
+
+    print(f"{'startup':<20}{'runs':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for r in results:
+        print(f"{r['workload']:<20}{r['runs']:>10}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['max_ms']:>10.1f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    return 0
+
+
+def representation_benchmark(args):
+    """Compare dict rows + jsonable_encoder against PostRecords + orjson"""
+    import tracemalloc
+    from cassandra.query import dict_factory
+    from fastapi.encoders import jsonable_encoder
+    from posts import post_row_factory, dumps
+
+    # SELECT * FROM posts column order: partition key, then the rest alphabetically
+    colnames = ["id", "comment_list", "comments", "content", "likes", "shares", "timestamp", "type"]
+    rows = []
+    for post in make_posts(args.representation, random.Random(args.seed)):
+        # Cassandra returns an empty list as null
+        post["comment_list"] = post["comment_list"] or None
+        post["timestamp"] = datetime.fromisoformat(post["timestamp"])
+        rows.append(tuple(post[name] for name in colnames))
+
+    def measure(factory):
+        # Only the row containers are counted; the column values are shared by both
+        tracemalloc.start()
+        built = factory(colnames, rows)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return built, size
+
+    def throughput(serialize, posts, repeat=3):
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            body = serialize(posts)
+            best = min(best, time.perf_counter() - started)
+        return len(posts) / best, len(body)
+
+    sample = min(len(rows), 100000)
+    results = []
+    for label, factory, serialize in (
+        ("dict+jsonable_encoder", dict_factory, lambda posts: json.dumps(
+            jsonable_encoder(posts), ensure_ascii=False, separators=(",", ":")
+        ).encode()),
+        ("PostRecord+orjson", post_row_factory, dumps)
+    ):
+        built, size = measure(factory)
+        posts_per_s, body_bytes = throughput(serialize, built[:sample])
+        results.append({
+            "representation": label,
+            "bytes_per_post": size / len(rows),
+            "mb_per_million": size / len(rows) * 1e6 / 2**20,
+            "serialize_posts_per_s": posts_per_s,
+            "body_bytes": body_bytes
+        })
+        del built
+
+    print(f"{'representation':<24}{'bytes/post':>12}{'MB/1M':>10}{'posts/s':>14}")
+    for r in results:
+        print(
+            f"{r['representation']:<24}{r['bytes_per_post']:>12.1f}"
+            f"{r['mb_per_million']:>10.1f}{r['serialize_posts_per_s']:>14.0f}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    return 0
+
+
+def similarity_benchmark(args):
+    """Time building the similarity index and top-10 queries against it"""
+    from similarity import SimilarityIndex
+
+    rng = random.Random(args.seed)
+    posts = make_posts(args.similarity, rng)
+    index = SimilarityIndex()
+    started = time.perf_counter()
+    index.fit(posts)
+    build_seconds = time.perf_counter() - started
+
+    latencies = []
+    for _ in range(args.requests):
+        content = rng.choice(posts)["content"]
+        started = time.perf_counter()
+        index.search(content, 10)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+
+    result = {
+        "posts": len(index),
+        "dim": index.dim,
+        "matrix_mb": len(index) * index.dim * 4 / 2**20,
+        "build_seconds": build_seconds,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000
+    }
+    print(
+        f"{result['posts']} posts x {result['dim']} dims ({result['matrix_mb']:.0f} MB), "
+        f"built in {build_seconds:.1f} s; top-10 query "
+        f"p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms"
+    )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": [result]}, f, indent=2)
+    return 0
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+
+    os.environ["LLM_STUB_LATENCY"] = str(args.llm_latency)
+    import main as api
+
+    async with Lifespan(api.app):
+        await wait_until_ready(api.app)
+        posts = make_posts(args.posts, rng)
+        for i in range(0, len(posts), 500):
+            response = await asgi_request(
+                api.app, *json_request("POST", "/batch-posts", {"posts": posts[i:i + 500]})
+            )
+            if response.status != 200:
+                raise RuntimeError(f"Seeding failed: {response.status} {response.body[:200]}")
+
+        workloads = {
+            "ingest_burst": ingest_requests(args.requests, args.batch_size, args.posts, rng),
+            "dashboard_polling": dashboard_requests(args.requests, rng),
+            "csv_import_export": csv_requests(max(args.requests // 10, 1), posts, rng),
+            "visualize": visualize_requests(max(args.requests // 4, 1), rng)
+        }
+        selected = args.workloads or list(workloads)
+
+        results = []
+        for name in selected:
+            results.append(await run_workload(name, api.app, workloads[name], args.concurrency))
+
+    header = f"{'workload':<20}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['workload']:<20}{r['requests']:>10}{r['errors']:>8}{r['throughput_rps']:>10.1f}"
+            f"{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    return 1 if any(r["errors"] for r in results) else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the analytics API in-process")
+    parser.add_argument("--posts", type=int, default=2000, help="posts to seed")
+    parser.add_argument("--requests", type=int, default=200, help="requests per workload")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent requests")
+    parser.add_argument("--batch-size", type=int, default=1000, help="events per ingest request")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="stub LLM latency in seconds")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--workloads", nargs="*",
+        choices=["ingest_burst", "dashboard_polling", "csv_import_export", "visualize"]
+    )
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--startup", type=int, metavar="RUNS", help="benchmark cold startup instead")
+    parser.add_argument("--startup-child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument(
+        "--representation", type=int, metavar="POSTS",
+        help="compare post row representations over this many posts instead"
+    )
+    parser.add_argument(
+        "--similarity", type=int, metavar="POSTS",
+        help="benchmark the content similarity index over this many posts instead"
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.startup_child:
+        asyncio.run(startup_child())
+    elif args.startup:
+        sys.exit(startup_benchmark(args))
+    elif args.representation:
+        sys.exit(representation_benchmark(args))
+    elif args.similarity:
+        sys.exit(similarity_benchmark(args))
+    else:
+        sys.exit(asyncio.run(main(args)))
@@ -1,15 +1,57 @@
-from datetime import datetime, date
-from db_config import get_session, KEYSPACE, init_database
+from datetime import datetime, date, timezone
+import zlib
+from db_config import (
+    get_session, KEYSPACE, init_database, CHANGE_LOG_SHARDS, POSTS_PROFILE
+)
+from hyperloglog import EngagementReach, event_day
+from storage import StorageBackend
+from posts import POST_FIELDS
+from metrics import InstrumentedSession, CACHE_REQUESTS, CQL_DURATION, CQL_ERRORS, statement_name
+import time
+from cassandra import InvalidRequest
+from cassandra.cluster import EXEC_PROFILE_DEFAULT
+from cassandra.protocol import ProtocolException, ServerError
 from cassandra.query import SimpleStatement
-import pandas as pd
+from cassandra.concurrent import execute_concurrent_with_args
 
-class DataStaxService:
+# Compare-and-set attempts per row before an engagement update is reported as failed
+CAS_ATTEMPTS = 10
+# Marks a content_performance row that doesn't exist yet
+MISSING = object()
+
+class DataStaxService(StorageBackend):
     def __init__(self):
-        self.session = get_session()
+        self.session = InstrumentedSession(get_session())
         # Initialize database (create keyspace and tables)
         init_database(self.session)
         # Set keyspace after creation
         self.session.set_keyspace(KEYSPACE)
+        # Unique engager sketches, updated from save_user_engagement
+        self.reach = EngagementReach(self)
+        self._post_types = {}
+        self._prepared = {}
+    
+    def _prepare(self, query):
+        """Prepare a statement once per session and reuse it"""
+        statement = self._prepared.get(query)
+        if statement is None:
+            statement = self._prepared[query] = self.session.prepare(query)
+        return statement
+    
+    def _execute_concurrent(self, statement, args, concurrency, execution_profile=EXEC_PROFILE_DEFAULT):
+        """Run a prepared statement for many parameter sets, recording its latency"""
+        name = statement_name(statement)
+        start = time.perf_counter()
+        results = execute_concurrent_with_args(
+            self.session, statement, args,
+            concurrency=concurrency, raise_on_first_error=False,
+            execution_profile=execution_profile
+        )
+        CQL_DURATION.labels(name).observe(time.perf_counter() - start)
+        failures = sum(1 for success, _ in results if not success)
+        if failures:
+            CQL_ERRORS.labels(name).inc(failures)
+        return results
     
     def save_post(self, post_data):
         """Save a post to DataStax"""
@@ -18,6 +60,10 @@ class DataStaxService:
                 id, type, content, likes, shares, comments, timestamp, comment_list
             ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
         """
+        timestamp = post_data["timestamp"]
+        if not isinstance(timestamp, datetime):
+            timestamp = datetime.fromisoformat(timestamp)
+        self._post_types[post_data["id"]] = post_data["type"]
         self.session.execute(query, (
             post_data["id"],
             post_data["type"],
@@ -25,16 +71,139 @@ class DataStaxService:
             post_data["likes"],
             post_data["shares"],
             post_data["comments"],
-            datetime.fromisoformat(post_data["timestamp"]),
+            timestamp,
             post_data.get("comment_list", [])
         ))
+        self._log_changes([post_data["id"]])
+    
+    def _log_changes(self, post_ids, concurrency=100):
+        """Record changed posts in post_changes so snapshots can replay them"""
+        now_ms = int(time.time() * 1000)
+        changed_at = datetime.fromtimestamp(now_ms / 1000, timezone.utc)
+        insert = self._prepare("""
+            INSERT INTO post_changes (bucket, shard, changed_at, post_id) VALUES (?, ?, ?, ?)
+        """)
+        args = [
+            (now_ms // 3600000, zlib.crc32(post_id.encode()) % CHANGE_LOG_SHARDS, changed_at, post_id)
+            for post_id in post_ids
+        ]
+        for success, result in self._execute_concurrent(insert, args, concurrency):
+            if not success:
+                raise result
     
     def get_post(self, post_id):
         """Retrieve a post by ID"""
         query = "SELECT * FROM posts WHERE id = %s"
-        result = self.session.execute(query, (post_id,))
+        result = self.session.execute(query, (post_id,), execution_profile=POSTS_PROFILE)
         return result.one()
-    
+
+    def get_posts(self, post_ids, concurrency=100):
+        """Retrieve many posts by ID concurrently, skipping missing ones"""
+        select = self._prepare("SELECT * FROM posts WHERE id = ?")
+        results = self._execute_concurrent(
+            select, [(post_id,) for post_id in post_ids], concurrency, POSTS_PROFILE
+        )
+        posts = []
+        for success, result in results:
+            if not success:
+                raise result
+            row = result.one()
+            if row is not None:
+                posts.append(row)
+        return posts
+
+    def get_changed_post_ids(self, since, concurrency=100):
+        """IDs of posts changed at or after since (epoch milliseconds)"""
+        select = self._prepare("""
+            SELECT post_id FROM post_changes
+            WHERE bucket = ? AND shard = ? AND changed_at >= ?
+        """)
+        changed_at = datetime.fromtimestamp(since / 1000, timezone.utc)
+        now_bucket = int(time.time() * 1000) // 3600000
+        args = [
+            (bucket, shard, changed_at)
+            for bucket in range(since // 3600000, now_bucket + 1)
+            for shard in range(CHANGE_LOG_SHARDS)
+        ]
+        post_ids = set()
+        for success, result in self._execute_concurrent(select, args, concurrency):
+            if not success:
+                raise result
+            post_ids.update(row["post_id"] for row in result)
+        return post_ids
+
+    def get_all_posts(self):
+        """Retrieve all posts"""
+        query = "SELECT * FROM posts"
+        return list(self.session.execute(query, execution_profile=POSTS_PROFILE))
+
+    def scan_posts(self, page_size=5000):
+        """Yield every post a page at a time, so a full scan never holds the whole table"""
+        statement = SimpleStatement("SELECT * FROM posts", fetch_size=page_size)
+        result = self.session.execute(statement, execution_profile=POSTS_PROFILE)
+        while True:
+            page = list(result.current_rows)
+            if page:
+                yield page
+            if not result.has_more_pages:
+                return
+            result.fetch_next_page()
+
+    def get_posts_by_type(self, post_type):
+        """Retrieve all posts of a given type"""
+        query = "SELECT * FROM posts WHERE type = %s ALLOW FILTERING"
+        return list(self.session.execute(query, (post_type,), execution_profile=POSTS_PROFILE))
+
+    def get_posts_page(self, limit, cursor=None, post_type=None, start=None, end=None,
+                       min_engagement=None, fields=None):
+        """One page of posts and the driver paging state for the next one (None when done).
+
+        fields narrows the SELECT (rows are then dicts of just those fields).
+        min_engagement can't be expressed in CQL, so it is applied to each
+        fetched page, which may then hold fewer than limit posts.
+        """
+        columns = list(fields or POST_FIELDS)
+        if min_engagement is not None:
+            columns += [c for c in ("likes", "shares", "comments") if c not in columns]
+        
+        clauses, params = [], []
+        if post_type is not None:
+            clauses.append("type = ?")
+            params.append(post_type)
+        if start is not None:
+            clauses.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("timestamp <= ?")
+            params.append(end)
+        query = f"SELECT {', '.join(columns)} FROM posts"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses) + " ALLOW FILTERING"
+        
+        statement = self._prepare(query).bind(params)
+        statement.fetch_size = limit
+        try:
+            result = self.session.execute(
+                statement, paging_state=cursor,
+                execution_profile=EXEC_PROFILE_DEFAULT if fields else POSTS_PROFILE
+            )
+        except (InvalidRequest, ProtocolException, ServerError) as e:
+            if cursor is None:
+                raise
+            # A foreign or garbled paging state is rejected as invalid, as a
+            # protocol error or as a server-side decoding failure
+            raise ValueError(f"Invalid cursor: {str(e)}")
+        
+        rows = result.current_rows
+        if min_engagement is not None:
+            rows = [
+                row for row in rows
+                if (row["likes"] or 0) + (row["shares"] or 0) + (row["comments"] or 0) >= min_engagement
+            ]
+        if fields:
+            rows = [{field: row[field] for field in fields} for row in rows]
+        return rows, result.paging_state
+
     def save_analytics(self, post_id, engagement_count, sentiment_score):
         """Save analytics data"""
         now = datetime.now()
@@ -70,8 +239,49 @@ class DataStaxService:
         """
         return self.session.execute(query)
     
-    def save_user_engagement(self, user_id, post_id, engagement_type):
-        """Save user engagement data"""
+    def get_post_type(self, post_id):
+        """Look up a post's type, cached in-process"""
+        post_type = self._post_types.get(post_id)
+        CACHE_REQUESTS.labels("post_type", "miss" if post_type is None else "hit").inc()
+        if post_type is None:
+            row = self.session.execute("SELECT type FROM posts WHERE id = %s", (post_id,)).one()
+            if row is None:
+                return None
+            if len(self._post_types) >= 100000:
+                self._post_types.clear()
+            post_type = self._post_types[post_id] = row["type"]
+        return post_type
+    
+    def get_post_types(self, post_ids, concurrency=100):
+        """{post_id: type} for the posts that exist, looking up cache misses concurrently"""
+        post_types = {}
+        misses = []
+        for post_id in post_ids:
+            post_type = self._post_types.get(post_id)
+            if post_type is None:
+                misses.append(post_id)
+            else:
+                post_types[post_id] = post_type
+        CACHE_REQUESTS.labels("post_type", "hit").inc(len(post_types))
+        CACHE_REQUESTS.labels("post_type", "miss").inc(len(misses))
+        if not misses:
+            return post_types
+        
+        select = self._prepare("SELECT type FROM posts WHERE id = ?")
+        results = self._execute_concurrent(select, [(post_id,) for post_id in misses], concurrency)
+        if len(self._post_types) + len(misses) > 100000:
+            self._post_types.clear()
+        for post_id, (success, result) in zip(misses, results):
+            if not success:
+                raise result
+            row = result.one()
+            if row is not None:
+                post_types[post_id] = self._post_types[post_id] = row["type"]
+        return post_types
+    
+    def save_user_engagement(self, user_id, post_id, engagement_type, timestamp=None):
+        """Save user engagement data (timestamp defaults to now, as naive UTC like every stored timestamp)"""
+        now = timestamp or datetime.now(timezone.utc).replace(tzinfo=None)
         query = """
             INSERT INTO user_engagement (
                 user_id, post_id, engagement_type, timestamp
@@ -81,18 +291,218 @@ class DataStaxService:
             user_id,
             post_id,
             engagement_type,
-            datetime.now()
+            now
+        ))
+        
+        query = """
+            INSERT INTO user_engagement_by_user (
+                user_id, timestamp, post_id, engagement_type
+            ) VALUES (%s, %s, %s, %s)
+        """
+        self.session.execute(query, (
+            user_id,
+            now,
+            post_id,
+            engagement_type
         ))
+        
+        self.reach.record([user_id], post_id, self.get_post_type(post_id), event_day(now))
     
-    def get_user_engagement_history(self, user_id):
-        """Get engagement history for a user"""
+    def save_user_engagements(self, events, concurrency=100):
+        """Save many (user_id, post_id, engagement_type, timestamp) events concurrently.
+
+        Returns the indices of the events that failed either insert.
+        """
+        statements = [
+            """
+            INSERT INTO user_engagement (
+                user_id, post_id, engagement_type, timestamp
+            ) VALUES (?, ?, ?, ?)
+            """,
+            """
+            INSERT INTO user_engagement_by_user (
+                user_id, timestamp, post_id, engagement_type
+            ) VALUES (?, ?, ?, ?)
+            """
+        ]
+        params = [
+            events,
+            [(user_id, ts, post_id, engagement_type) for user_id, post_id, engagement_type, ts in events]
+        ]
+        failed = set()
+        for query, args in zip(statements, params):
+            results = self._execute_concurrent(self._prepare(query), args, concurrency)
+            failed.update(i for i, (success, _) in enumerate(results) if not success)
+        return failed
+    
+    def add_post_engagement(self, deltas, concurrency=100):
+        """Apply {post_id: (likes, shares, comments)} deltas to the posts table.
+
+        Returns ({post_id: type} for the posts updated, set of post ids whose
+        update failed). The columns are plain ints, so each post is updated
+        with a compare-and-set on its current counts, retried with the counts
+        a rejected write reports, so concurrent batches never lose increments.
+        """
+        select = self._prepare("SELECT id, type, likes, shares, comments FROM posts WHERE id = ?")
+        post_ids = list(deltas)
+        rows = self._execute_concurrent(select, [(post_id,) for post_id in post_ids], concurrency)
+        current = {}
+        post_types = {}
+        failed = set()
+        for post_id, (success, result) in zip(post_ids, rows):
+            if not success:
+                failed.add(post_id)
+                continue
+            row = result.one()
+            if row is None:
+                continue
+            current[post_id] = (row["likes"], row["shares"], row["comments"])
+            post_types[post_id] = self._post_types[post_id] = row["type"]
+        
+        update = self._prepare("""
+            UPDATE posts SET likes = ?, shares = ?, comments = ? WHERE id = ?
+            IF likes = ? AND shares = ? AND comments = ?
+        """)
+        for _ in range(CAS_ATTEMPTS):
+            if not current:
+                break
+            keys = list(current)
+            args = []
+            for post_id in keys:
+                counts = current[post_id]
+                added = tuple((count or 0) + delta for count, delta in zip(counts, deltas[post_id]))
+                args.append(added + (post_id,) + counts)
+            results = self._execute_concurrent(update, args, concurrency)
+            current = {}
+            for post_id, (success, result) in zip(keys, results):
+                if not success:
+                    failed.add(post_id)
+                    continue
+                row = result.one()
+                if row["[applied]"]:
+                    continue
+                if "likes" not in row:
+                    # Deleted since it was read
+                    post_types.pop(post_id, None)
+                    continue
+                current[post_id] = (row["likes"], row["shares"], row["comments"])
+        # Still contended after every attempt
+        failed.update(current)
+        
+        for post_id in failed:
+            post_types.pop(post_id, None)
+        self._log_changes(list(post_types), concurrency)
+        return post_types, failed
+    
+    def add_content_performance(self, deltas, concurrency=100):
+        """Apply {(post_type, date, hour): engagement} deltas to content_performance.
+
+        Returns the set of keys whose update failed. Like add_post_engagement,
+        each row is a compare-and-set retried on contention (an insert if
+        the row doesn't exist yet).
+        """
+        select = self._prepare("""
+            SELECT total_engagement FROM content_performance
+            WHERE post_type = ? AND date = ? AND hour = ?
+        """)
+        keys = list(deltas)
+        rows = self._execute_concurrent(select, keys, concurrency)
+        # key -> current total_engagement, or MISSING when there is no row
+        current = {}
+        failed = set()
+        for key, (success, result) in zip(keys, rows):
+            if not success:
+                failed.add(key)
+                continue
+            row = result.one()
+            current[key] = row["total_engagement"] if row else MISSING
+        
+        insert = self._prepare("""
+            INSERT INTO content_performance (post_type, date, hour, total_engagement)
+            VALUES (?, ?, ?, ?) IF NOT EXISTS
+        """)
+        update = self._prepare("""
+            UPDATE content_performance SET total_engagement = ?
+            WHERE post_type = ? AND date = ? AND hour = ?
+            IF total_engagement = ?
+        """)
+        for _ in range(CAS_ATTEMPTS):
+            if not current:
+                break
+            inserts = [key for key, total in current.items() if total is MISSING]
+            updates = [key for key, total in current.items() if total is not MISSING]
+            results = list(zip(inserts, self._execute_concurrent(
+                insert, [tuple(key) + (deltas[key],) for key in inserts], concurrency
+            ))) + list(zip(updates, self._execute_concurrent(
+                update,
+                [((current[key] or 0) + deltas[key],) + tuple(key) + (current[key],) for key in updates],
+                concurrency
+            )))
+            current = {}
+            for key, (success, result) in results:
+                if not success:
+                    failed.add(key)
+                    continue
+                row = result.one()
+                if not row["[applied]"]:
+                    current[key] = row["total_engagement"] if "total_engagement" in row else MISSING
+        failed.update(current)
+        return failed
+    
+    def get_user_engagement_history(self, user_id, limit=100):
+        """Get engagement history for a user, newest first"""
         query = """
             SELECT post_id, engagement_type, timestamp
-            FROM user_engagement
+            FROM user_engagement_by_user
             WHERE user_id = %s
+            LIMIT %s
         """
-        return self.session.execute(query, (user_id,))
+        return self.session.execute(query, (user_id, limit))
     
+    def save_reach_sketches(self, rows, concurrency=100):
+        """Save many (scope, key, day, writer_id, sketch) rows concurrently.
+
+        Returns the (scope, key, day, writer_id) of the rows that failed.
+        """
+        insert = self._prepare("""
+            INSERT INTO reach_sketches (
+                scope, key, date, writer_id, sketch
+            ) VALUES (?, ?, ?, ?, ?)
+        """)
+        results = self._execute_concurrent(insert, rows, concurrency)
+        return {row[:4] for row, (success, _) in zip(rows, results) if not success}
+
+    def get_writer_reach_sketches(self, keys, writer_id, concurrency=100):
+        """Get one writer's sketches for many (scope, key, day) keys concurrently.
+
+        Returns {(scope, key, day): sketch} for the rows that exist.
+        """
+        select = self._prepare("""
+            SELECT sketch FROM reach_sketches
+            WHERE scope = ? AND key = ? AND date = ? AND writer_id = ?
+        """)
+        results = self._execute_concurrent(select, [(*key, writer_id) for key in keys], concurrency)
+        sketches = {}
+        for key, (success, result) in zip(keys, results):
+            if not success:
+                raise result
+            row = result.one()
+            if row is not None:
+                sketches[key] = row["sketch"]
+        return sketches
+    
+    def get_reach_sketches(self, scope, key, start_date=None, end_date=None):
+        """Get all writers' unique engager sketches for a date range"""
+        query = "SELECT date, writer_id, sketch FROM reach_sketches WHERE scope = %s AND key = %s"
+        params = [scope, key]
+        if start_date is not None:
+            query += " AND date >= %s"
+            params.append(start_date)
+        if end_date is not None:
+            query += " AND date <= %s"
+            params.append(end_date)
+        return self.session.execute(query, params)
+
     def update_content_performance(self, post_type, engagement_delta, sentiment_score):
         """Update content performance metrics"""
         now = datetime.now()
@@ -112,8 +522,58 @@ class DataStaxService:
             now.hour
         ))
     
+    def save_engagement_sketches(self, rows, concurrency=100):
+        """Save many (post_type, day, metric, writer_id, sketch) rows concurrently.
+
+        Returns the (post_type, day, metric, writer_id) of the rows that failed.
+        """
+        insert = self._prepare("""
+            INSERT INTO engagement_sketches (
+                post_type, date, metric, writer_id, sketch
+            ) VALUES (?, ?, ?, ?, ?)
+        """)
+        results = self._execute_concurrent(insert, rows, concurrency)
+        return {row[:4] for row, (success, _) in zip(rows, results) if not success}
+    
+    def get_writer_engagement_sketches(self, keys, writer_id, concurrency=100):
+        """Get one writer's sketches for many (post_type, day, metric) keys concurrently.
+
+        Returns {(post_type, day, metric): sketch} for the rows that exist.
+        """
+        select = self._prepare("""
+            SELECT sketch FROM engagement_sketches
+            WHERE post_type = ? AND date = ? AND metric = ? AND writer_id = ?
+        """)
+        results = self._execute_concurrent(select, [(*key, writer_id) for key in keys], concurrency)
+        sketches = {}
+        for key, (success, result) in zip(keys, results):
+            if not success:
+                raise result
+            row = result.one()
+            if row is not None:
+                sketches[key] = row["sketch"]
+        return sketches
+
+    def get_engagement_sketches(self, post_type, start_date=None, end_date=None):
+        """Get the serialized quantile sketches for a post type within a date range"""
+        query = "SELECT date, metric, writer_id, sketch FROM engagement_sketches WHERE post_type = %s"
+        params = [post_type]
+        if start_date is not None:
+            query += " AND date >= %s"
+            params.append(start_date)
+        if end_date is not None:
+            query += " AND date <= %s"
+            params.append(end_date)
+        return self.session.execute(query, params)
+    
+    def has_engagement_sketches(self):
+        """Check whether any quantile sketches have been stored"""
+        query = "SELECT post_type FROM engagement_sketches LIMIT 1"
+        return self.session.execute(query).one() is not None
+    
     def get_analytics_dataframe(self, start_date, end_date):
         """Get analytics data as a pandas DataFrame"""
+        import pandas as pd
         query = """
             SELECT post_id, date, hour, engagement_count, sentiment_score
             FROM analytics
@@ -123,7 +583,35 @@ class DataStaxService:
         rows = self.session.execute(query, (start_date, end_date))
         return pd.DataFrame(list(rows))
 
+    def acquire_lease(self, name, owner, ttl_seconds):
+        """Take or renew the named lease for ttl_seconds unless another owner holds it"""
+        query = "INSERT INTO job_leases (name, owner) VALUES (%s, %s) IF NOT EXISTS USING TTL %s"
+        row = self.session.execute(query, (name, owner, int(ttl_seconds))).one()
+        if row["[applied]"]:
+            return True
+        # A rejected lightweight transaction returns the current holder
+        if row.get("owner") != owner:
+            return False
+        # Already ours: push the expiry out, unless it lapsed and someone else took it meanwhile
+        query = "UPDATE job_leases USING TTL %s SET owner = %s WHERE name = %s IF owner = %s"
+        row = self.session.execute(query, (int(ttl_seconds), owner, name, owner)).one()
+        return row["[applied]"]
+    
+    def save_report(self, name, data_version, computed_at, payload):
+        """Save the latest result of a background job"""
+        query = """
+            INSERT INTO reports (name, data_version, computed_at, payload)
+            VALUES (%s, %s, %s, %s)
+        """
+        self.session.execute(query, (name, data_version, computed_at, payload))
+    
+    def get_report(self, name):
+        """Get the latest result of a background job, or None"""
+        query = "SELECT name, data_version, computed_at, payload FROM reports WHERE name = %s"
+        return self.session.execute(query, (name,)).one()
+    
     def close(self):
         """Close the DataStax session"""
         if self.session:
+            self.reach.flush()
             self.session.shutdown()
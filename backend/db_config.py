@@ -1,7 +1,12 @@
-from cassandra.cluster import Cluster
+from cassandra.cluster import Cluster, ExecutionProfile, EXEC_PROFILE_DEFAULT
 from cassandra.auth import PlainTextAuthProvider
 from cassandra.query import dict_factory
+from posts import post_row_factory
+import fcntl
 import os
+import socket
+import tempfile
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,6 +16,54 @@ DATASTAX_CLIENT_ID = os.getenv('DATASTAX_CLIENT_ID')
 DATASTAX_CLIENT_SECRET = os.getenv('DATASTAX_CLIENT_SECRET')
 KEYSPACE = "social_media_analytics"
 
+# Execution profile whose rows come back as PostRecords instead of dicts
+POSTS_PROFILE = "posts"
+
+_writer_slot = None
+
+
+def claim_writer_id(prefix=None, lock_dir=None):
+    """Stable id for this process's rows in the per-writer sketch tables.
+
+    The id is the host (or SKETCH_WRITER_ID) plus the lowest worker slot no
+    other live process on the host holds, so a restarted worker resumes its
+    predecessor's rows instead of adding new ones. The slot is an flock
+    released when the process exits.
+    """
+    global _writer_slot
+    prefix = prefix or os.getenv("SKETCH_WRITER_ID") or socket.gethostname()
+    lock_dir = lock_dir or os.getenv("SKETCH_WRITER_LOCK_DIR", tempfile.gettempdir())
+    slot = 0
+    while True:
+        lock = open(os.path.join(lock_dir, f"sketch-writer-{prefix}-{slot}.lock"), "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            slot += 1
+            continue
+        # Held until this process exits
+        _writer_slot = lock
+        return f"{prefix}:{slot}"
+
+
+_writer_id = None
+_writer_id_lock = threading.Lock()
+
+
+def get_writer_id():
+    """Id of this process's rows in the per-writer sketch tables, claimed on first use"""
+    global _writer_id
+    with _writer_id_lock:
+        if _writer_id is None:
+            _writer_id = claim_writer_id()
+        return _writer_id
+
+# post_changes rows are partitioned by hour and spread over this many shards
+CHANGE_LOG_SHARDS = 16
+# How long post_changes rows are kept; older snapshots are rebuilt rather than replayed
+CHANGE_LOG_TTL_SECONDS = 7 * 24 * 3600
+
 def get_cluster():
     """Create and return a connection to the DataStax cluster"""
     cloud_config = {
@@ -18,36 +71,24 @@ def get_cluster():
     }
     
     auth_provider = PlainTextAuthProvider(DATASTAX_CLIENT_ID, DATASTAX_CLIENT_SECRET)
-    cluster = Cluster(cloud=cloud_config, auth_provider=auth_provider)
+    profiles = {
+        EXEC_PROFILE_DEFAULT: ExecutionProfile(row_factory=dict_factory),
+        POSTS_PROFILE: ExecutionProfile(row_factory=post_row_factory)
+    }
+    cluster = Cluster(cloud=cloud_config, auth_provider=auth_provider, execution_profiles=profiles)
     return cluster
 
 def get_session():
     """Get a session to the DataStax cluster"""
     cluster = get_cluster()
     session = cluster.connect()
-    session.row_factory = dict_factory
     return session
 
-def init_database(session=None):
-    """Initialize the database with required tables"""
-    if session is None:
-        session = get_session()
-    
-    try:
-        # Create keyspace if not exists
-        session.execute(f"""
-            CREATE KEYSPACE IF NOT EXISTS {KEYSPACE}
-            WITH replication = {{
-                'class': 'SimpleStrategy',
-                'replication_factor': 1
-            }}
-        """)
-        
-        # Switch to the keyspace
-        session.set_keyspace(KEYSPACE)
-        
-        # Create posts table
-        session.execute("""
+# Versioned schema migrations: (version, description, statements).
+# Append new entries; never edit one that has shipped.
+MIGRATIONS = [
+    (1, "Core tables", [
+        """
             CREATE TABLE IF NOT EXISTS posts (
                 id text PRIMARY KEY,
                 type text,
@@ -58,10 +99,8 @@ def init_database(session=None):
                 timestamp timestamp,
                 comment_list list<text>
             )
-        """)
-        
-        # Create analytics table
-        session.execute("""
+        """,
+        """
             CREATE TABLE IF NOT EXISTS analytics (
                 post_id text,
                 date date,
@@ -70,10 +109,8 @@ def init_database(session=None):
                 sentiment_score float,
                 PRIMARY KEY ((post_id), date, hour)
             )
-        """)
-        
-        # Create user_engagement table
-        session.execute("""
+        """,
+        """
             CREATE TABLE IF NOT EXISTS user_engagement (
                 user_id text,
                 post_id text,
@@ -81,10 +118,8 @@ def init_database(session=None):
                 timestamp timestamp,
                 PRIMARY KEY ((user_id, post_id))
             )
-        """)
-        
-        # Create content_performance table
-        session.execute("""
+        """,
+        """
             CREATE TABLE IF NOT EXISTS content_performance (
                 post_type text,
                 date date,
@@ -93,10 +128,140 @@ def init_database(session=None):
                 avg_sentiment float,
                 PRIMARY KEY ((post_type), date, hour)
             )
+        """
+    ]),
+    (2, "Engagement quantile sketches", [
+        """
+            CREATE TABLE IF NOT EXISTS engagement_sketches (
+                post_type text,
+                date date,
+                metric text,
+                writer_id text,
+                sketch blob,
+                PRIMARY KEY ((post_type), date, metric, writer_id)
+            )
+        """
+    ]),
+    (3, "Per-user engagement history and reach sketches", [
+        """
+            CREATE TABLE IF NOT EXISTS user_engagement_by_user (
+                user_id text,
+                timestamp timestamp,
+                post_id text,
+                engagement_type text,
+                PRIMARY KEY ((user_id), timestamp, post_id)
+            ) WITH CLUSTERING ORDER BY (timestamp DESC, post_id ASC)
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS reach_sketches (
+                scope text,
+                key text,
+                date date,
+                writer_id text,
+                sketch blob,
+                PRIMARY KEY ((scope, key), date, writer_id)
+            )
+        """
+    ]),
+    (4, "Post change log for snapshot replay", [
+        f"""
+            CREATE TABLE IF NOT EXISTS post_changes (
+                bucket int,
+                shard int,
+                changed_at timestamp,
+                post_id text,
+                PRIMARY KEY ((bucket, shard), changed_at, post_id)
+            ) WITH default_time_to_live = {CHANGE_LOG_TTL_SECONDS}
+        """
+    ]),
+    (5, "Background job leases and precomputed reports", [
+        """
+            CREATE TABLE IF NOT EXISTS job_leases (
+                name text PRIMARY KEY,
+                owner text
+            )
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS reports (
+                name text PRIMARY KEY,
+                data_version text,
+                computed_at timestamp,
+                payload text
+            )
+        """
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# Apply pending migrations at boot; set to false to require `python db_config.py`
+SCHEMA_AUTO_MIGRATE = os.getenv("SCHEMA_AUTO_MIGRATE", "true").lower() == "true"
+
+def get_schema_version(session):
+    """Return the applied schema version (0 for a fresh cluster)"""
+    # Cluster metadata is already loaded by connect(), so these checks cost no round trips
+    keyspace = session.cluster.metadata.keyspaces.get(KEYSPACE)
+    if keyspace is None or "schema_version" not in keyspace.tables:
+        return 0
+    row = session.execute(
+        f"SELECT version FROM {KEYSPACE}.schema_version WHERE id = 'schema'"
+    ).one()
+    return row["version"] if row else 0
+
+def migrate(session, current=None):
+    """Apply every migration newer than the current schema version"""
+    if current is None:
+        current = get_schema_version(session)
+    
+    if current == 0:
+        session.execute(f"""
+            CREATE KEYSPACE IF NOT EXISTS {KEYSPACE}
+            WITH replication = {{
+                'class': 'SimpleStrategy',
+                'replication_factor': 1
+            }}
+        """)
+        session.execute(f"""
+            CREATE TABLE IF NOT EXISTS {KEYSPACE}.schema_version (
+                id text PRIMARY KEY,
+                version int
+            )
         """)
-        
+    
+    session.set_keyspace(KEYSPACE)
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        for statement in statements:
+            session.execute(statement)
+        session.execute(
+            "INSERT INTO schema_version (id, version) VALUES ('schema', %s)", (version,)
+        )
+        print(f"Applied schema migration {version}: {description}")
+    return session
+
+def init_database(session=None):
+    """Make sure the schema is current, migrating only when it is behind"""
+    if session is None:
+        session = get_session()
+    
+    try:
+        current = get_schema_version(session)
+        if current >= SCHEMA_VERSION:
+            return session
+        if not SCHEMA_AUTO_MIGRATE:
+            raise RuntimeError(
+                f"Schema version {current} is behind {SCHEMA_VERSION}; run `python db_config.py`"
+            )
+        migrate(session, current)
         print("Database initialized successfully")
         return session
     except Exception as e:
         print(f"Error initializing database: {str(e)}")
         raise
+
+if __name__ == "__main__":
+    session = get_session()
+    migrate(session)
+    print(f"Schema is at version {SCHEMA_VERSION}")
+    session.cluster.shutdown()
@@ -0,0 +1,265 @@
+import json
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Engagement types and the posts column each one increments
+ENGAGEMENT_TYPES = np.array(["like", "share", "comment"])
+
+# Maximum number of rejected row indices echoed back per batch
+MAX_REPORTED_ERRORS = 100
+
+# NDJSON events are validated and written in chunks of this many rows
+NDJSON_CHUNK_SIZE = 5000
+
+# Timestamps must convert to a Python datetime; anything outside this range is rejected
+_MIN_TIMESTAMP = np.datetime64(datetime.min, "ms")
+_MAX_TIMESTAMP = np.datetime64(datetime.max, "ms")
+_MIN_EPOCH_MS = _MIN_TIMESTAMP.astype(np.int64)
+_MAX_EPOCH_MS = _MAX_TIMESTAMP.astype(np.int64)
+
+
+class EventBatch:
+    """A columnar batch of engagement events (parallel arrays)"""
+
+    def __init__(self, user_id, post_id, engagement_type, timestamp=None):
+        lengths = {len(user_id), len(post_id), len(engagement_type)}
+        if timestamp is not None:
+            lengths.add(len(timestamp))
+        if len(lengths) != 1:
+            raise ValueError("user_id, post_id, engagement_type and timestamp must have the same length")
+
+        self.user_id = _as_str_array(user_id)
+        self.post_id = _as_str_array(post_id)
+        self.engagement_type = np.char.lower(_as_str_array(engagement_type))
+        self.timestamp = _parse_timestamps(timestamp, len(self.user_id))
+
+    def __len__(self):
+        return len(self.user_id)
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Build a batch from a {column: [values]} mapping"""
+        try:
+            return cls(
+                columns["user_id"],
+                columns["post_id"],
+                columns["engagement_type"],
+                columns.get("timestamp")
+            )
+        except KeyError as e:
+            raise ValueError(f"Missing column: {e.args[0]}")
+
+    @classmethod
+    def from_records(cls, records):
+        """Build a batch from a list of event dicts"""
+        columns = {"user_id": [], "post_id": [], "engagement_type": [], "timestamp": []}
+        for record in records:
+            for column, values in columns.items():
+                values.append(record.get(column))
+        return cls.from_columns(columns)
+
+    @classmethod
+    def from_arrow(cls, payload):
+        """Build a batch from an Arrow IPC stream (requires pyarrow)"""
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ValueError("Arrow payloads require pyarrow to be installed")
+        table = pa.ipc.open_stream(payload).read_all()
+        columns = {name: table.column(name).to_pylist() for name in table.column_names}
+        return cls.from_columns(columns)
+
+    def validate(self):
+        """Return a boolean mask of valid rows"""
+        return (
+            (np.char.str_len(self.user_id) > 0)
+            & (np.char.str_len(self.post_id) > 0)
+            & np.isin(self.engagement_type, ENGAGEMENT_TYPES)
+            & ~np.isnat(self.timestamp)
+        )
+
+    def select(self, mask):
+        """Return a new batch containing only the rows in mask"""
+        batch = EventBatch.__new__(EventBatch)
+        batch.user_id = self.user_id[mask]
+        batch.post_id = self.post_id[mask]
+        batch.engagement_type = self.engagement_type[mask]
+        batch.timestamp = self.timestamp[mask]
+        return batch
+
+
+def _as_str_array(values):
+    # Missing values become empty strings so validate() rejects them
+    values = np.asarray(values, dtype=object)
+    values[np.equal(values, None)] = ""
+    return values.astype(str)
+
+
+def _parse_timestamps(values, n):
+    # Events without a timestamp get server time, stored as naive UTC like every other timestamp
+    now = np.datetime64(datetime.now(timezone.utc).replace(tzinfo=None), "ms")
+    if values is None:
+        return np.full(n, now)
+    parsed = np.empty(n, dtype="datetime64[ms]")
+    values = np.asarray(values, dtype=object)
+    missing = np.equal(values, None)
+    parsed[missing] = now
+    values = values[~missing]
+    numeric = np.array([isinstance(v, (int, float)) and not isinstance(v, bool) for v in values], dtype=bool)
+    # Numbers are epoch milliseconds; everything else must be an ISO 8601 string
+    present = np.flatnonzero(~missing)
+    epoch_ms = values[numeric].astype(float)
+    # Range-check before converting: a huge or non-finite number would overflow int64
+    in_range = np.isfinite(epoch_ms) & (epoch_ms >= _MIN_EPOCH_MS) & (epoch_ms <= _MAX_EPOCH_MS)
+    epoch_ms[~in_range] = 0
+    parsed[present[numeric]] = np.where(
+        in_range, epoch_ms.astype("int64").astype("datetime64[ms]"), np.datetime64("NaT")
+    )
+    strings = np.char.rstrip(values[~numeric].astype(str), "Z")
+    try:
+        parsed[present[~numeric]] = strings.astype("datetime64[ms]")
+    except ValueError:
+        # At least one bad value: fall back to row by row so only it is rejected
+        for i, value in zip(present[~numeric], strings):
+            try:
+                parsed[i] = np.datetime64(value, "ms")
+            except ValueError:
+                parsed[i] = np.datetime64("NaT")
+    # ISO strings can name years datetime can't represent (e.g. 10000-01-01)
+    parsed[(parsed < _MIN_TIMESTAMP) | (parsed > _MAX_TIMESTAMP)] = np.datetime64("NaT")
+    return parsed
+
+
+def aggregate(batch):
+    """Group a validated batch into per-post and per-(post, day) aggregates.
+
+    Returns (post_deltas, post_days) where post_deltas maps post_id to
+    (likes, shares, comments) and post_days maps (post_id, date, hour) to the
+    engagement count and the user ids seen in that slot.
+    """
+    # ENGAGEMENT_TYPES is not sorted, so search in sorted order and map back
+    order = np.argsort(ENGAGEMENT_TYPES)
+    type_index = order[np.searchsorted(ENGAGEMENT_TYPES[order], batch.engagement_type)]
+
+    posts, post_index = np.unique(batch.post_id, return_inverse=True)
+    counts = np.zeros((len(posts), len(ENGAGEMENT_TYPES)), dtype=np.int64)
+    np.add.at(counts, (post_index, type_index), 1)
+    post_deltas = {
+        str(post_id): tuple(int(c) for c in row) for post_id, row in zip(posts, counts)
+    }
+
+    hours = batch.timestamp.astype("datetime64[h]").astype(np.int64)
+    base_hour = hours.min()
+    slot_keys = post_index.astype(np.int64) * (1 << 32) + (hours - base_hour)
+    slots, slot_index = np.unique(slot_keys, return_inverse=True)
+
+    # Sort rows by slot once so each slot's user ids are a contiguous run
+    by_slot = np.argsort(slot_index, kind="stable")
+    bounds = np.searchsorted(slot_index[by_slot], np.arange(len(slots) + 1))
+    user_ids = batch.user_id[by_slot]
+
+    post_days = {}
+    for i, slot in enumerate(slots):
+        hour = np.datetime64(int(slot % (1 << 32) + base_hour), "h").astype(datetime)
+        start, end = bounds[i], bounds[i + 1]
+        post_days[(str(posts[slot >> 32]), hour.date(), hour.hour)] = (
+            int(end - start),
+            user_ids[start:end].tolist()
+        )
+    return post_deltas, post_days
+
+
+def ingest_batch(db, batch):
+    """Validate a batch and write it through, updating counters and rollups once per batch.
+
+    Events for posts that don't exist are rejected along with malformed ones
+    and are not written anywhere. An event is reported as failed (with its
+    row index) only if none of its counts were applied: its user_engagement
+    write or its post counter update failed. Retrying failed rows is safe,
+    since the event rows and reach sketches are idempotent. Accepted events
+    whose hourly content_performance rollup could not be updated are counted
+    in rollup_failed; their post counts did move, so they must not be retried.
+    """
+    mask = batch.validate()
+    if mask.any():
+        post_ids = np.unique(batch.post_id[mask]).tolist()
+        known = list(db.get_post_types(post_ids))
+        mask &= np.isin(batch.post_id, known)
+    rejected = np.flatnonzero(~mask)
+    valid_rows = np.flatnonzero(mask)
+    valid = batch.select(mask)
+    failed = np.zeros(len(valid), dtype=bool)
+    rollup_failed = 0
+
+    if len(valid):
+        timestamps = valid.timestamp.astype(datetime)
+        failed_events = db.save_user_engagements(list(zip(
+            valid.user_id.tolist(),
+            valid.post_id.tolist(),
+            valid.engagement_type.tolist(),
+            timestamps.tolist()
+        )))
+        if failed_events:
+            failed[list(failed_events)] = True
+
+        saved = valid.select(~failed)
+        if len(saved):
+            post_deltas, post_days = aggregate(saved)
+            post_types, failed_posts = db.add_post_engagement(post_deltas)
+
+            performance = {}
+            slots = []
+            for (post_id, day, hour), (count, user_ids) in post_days.items():
+                post_type = post_types.get(post_id)
+                if post_type is None:
+                    # Its counter update failed: the whole event is retried
+                    continue
+                slots.append((user_ids, post_id, post_type, day))
+                key = (post_type, day, hour)
+                performance[key] = performance.get(key, 0) + count
+            db.reach.record_many(slots)
+            failed_slots = db.add_content_performance(performance)
+
+            if failed_posts:
+                failed |= np.isin(valid.post_id, list(failed_posts))
+            rollup_failed = sum(performance[key] for key in failed_slots)
+
+    failed_rows = valid_rows[failed]
+    return {
+        "accepted": int(len(valid) - len(failed_rows)),
+        "rejected": int(len(rejected)),
+        "rejected_rows": rejected[:MAX_REPORTED_ERRORS].tolist(),
+        "failed": int(len(failed_rows)),
+        "failed_rows": failed_rows[:MAX_REPORTED_ERRORS].tolist(),
+        "rollup_failed": int(rollup_failed)
+    }
+
+
+def merge_results(total, result, offset=0):
+    """Combine per-chunk ingest results into a running total"""
+    total["accepted"] += result["accepted"]
+    total["rejected"] += result["rejected"]
+    total["failed"] += result["failed"]
+    total["rollup_failed"] += result["rollup_failed"]
+    for rows in ("rejected_rows", "failed_rows"):
+        room = MAX_REPORTED_ERRORS - len(total[rows])
+        total[rows].extend(i + offset for i in result[rows][:room])
+    return total
+
+
+def parse_ndjson_line(line):
+    """Parse one NDJSON line into an event dict (or None for blank lines).
+
+    Earlier chunks may already be written by the time a line is parsed, so a
+    malformed line must not fail the request: it becomes an empty event,
+    which validate() rejects as its own row.
+    """
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return {}
+    return record if isinstance(record, dict) else {}
@@ -0,0 +1,110 @@
+"""
+Plotly figure builders for the /visualize endpoints.
+
+These are pure functions of plain Python data so they can run in the
+process pool (see main.run_cpu) without touching the database; each returns
+the figure serialized with fig.to_json().
+"""
+
+
+def preload():
+    """Import plotly and pandas so the first figure a pool worker builds is not slowed by them"""
+    import pandas  # noqa: F401
+    import plotly.express  # noqa: F401
+    from plotly.subplots import make_subplots  # noqa: F401
+
+
+def engagement_trends_figure(post_types, metrics):
+    """Bar charts of average likes, shares and comments per post type"""
+    from plotly import graph_objects as go
+    from plotly.subplots import make_subplots
+
+    # Create subplot with 3 metrics
+    fig = make_subplots(
+        rows=3, cols=1,
+        subplot_titles=("Average Likes", "Average Shares", "Average Comments"),
+        vertical_spacing=0.1
+    )
+
+    # Add bar traces for each metric
+    fig.add_trace(go.Bar(x=post_types, y=metrics["likes"], name="Likes"), row=1, col=1)
+    fig.add_trace(go.Bar(x=post_types, y=metrics["shares"], name="Shares"), row=2, col=1)
+    fig.add_trace(go.Bar(x=post_types, y=metrics["comments"], name="Comments"), row=3, col=1)
+
+    # Update layout
+    fig.update_layout(
+        height=800,
+        showlegend=False,
+        title_text="Engagement Metrics by Post Type",
+        template="plotly_dark"
+    )
+
+    return fig.to_json()
+
+
+def performance_heatmap_figure(hourly_engagement):
+    """Heatmap of mean engagement by post type and hour of day"""
+    from plotly import graph_objects as go
+
+    post_types = list(hourly_engagement)
+    fig = go.Figure(data=go.Heatmap(
+        z=[hourly_engagement[post_type] for post_type in post_types],
+        x=list(range(24)),
+        y=post_types,
+        colorscale="Viridis"
+    ))
+
+    fig.update_layout(
+        title="Engagement Heatmap: Post Type vs. Hour of Day",
+        xaxis_title="Hour of Day",
+        yaxis_title="Post Type",
+        template="plotly_dark"
+    )
+
+    return fig.to_json()
+
+
+def content_impact_figure(content_data):
+    """Bubble chart of engagement against virality, sized by comments"""
+    import pandas as pd
+    import plotly.express as px
+
+    df = pd.DataFrame(content_data)
+
+    # Create bubble chart
+    fig = px.scatter(
+        df,
+        x="engagement",
+        y="virality",
+        size="comments",
+        color="type",
+        hover_name="type",
+        title="Content Impact Analysis",
+        labels={
+            "engagement": "Total Engagement",
+            "virality": "Virality Score",
+            "comments": "Number of Comments"
+        }
+    )
+
+    fig.update_layout(template="plotly_dark")
+
+    return fig.to_json()
+
+
+def sentiment_distribution_figure(post_id, positive, negative, neutral):
+    """Donut chart of comment sentiment counts"""
+    from plotly import graph_objects as go
+
+    fig = go.Figure(data=[go.Pie(
+        labels=['Positive', 'Negative', 'Neutral'],
+        values=[positive, negative, neutral],
+        hole=.3
+    )])
+
+    fig.update_layout(
+        title=f"Sentiment Distribution for Post {post_id}",
+        template="plotly_dark"
+    )
+
+    return fig.to_json()
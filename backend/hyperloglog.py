@@ -0,0 +1,205 @@
+import hashlib
+import math
+import struct
+import threading
+import time
+from datetime import datetime, date, timedelta
+
+import numpy as np
+
+from db_config import get_writer_id
+
+# 2^12 registers: ~1.6% standard error, 4 KB per sketch when dense
+PRECISION = 12
+N_REGISTERS = 1 << PRECISION
+
+_DENSE = 0
+_SPARSE = 1
+
+# Persist dirty sketches at most this often (seconds); close() always flushes
+FLUSH_INTERVAL = 5.0
+
+
+def _hash64(value):
+    digest = hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class HyperLogLog:
+    """Approximate distinct counter that merges by taking register maxima"""
+
+    def __init__(self, registers=None):
+        if registers is None:
+            registers = np.zeros(N_REGISTERS, dtype=np.uint8)
+        self.registers = registers
+
+    def add(self, value):
+        """Add a single value"""
+        self.add_many([value])
+
+    def add_many(self, values):
+        """Add an iterable of values"""
+        indices = []
+        ranks = []
+        width = 64 - PRECISION
+        mask = (1 << width) - 1
+        for value in values:
+            h = _hash64(value)
+            indices.append(h >> width)
+            ranks.append(width - (h & mask).bit_length() + 1)
+        if indices:
+            np.maximum.at(self.registers, np.asarray(indices), np.asarray(ranks, dtype=np.uint8))
+
+    def merge(self, other):
+        """Merge another sketch into this one"""
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        """Estimate the number of distinct values added"""
+        m = N_REGISTERS
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        """Serialize, using a sparse encoding while few registers are set"""
+        nonzero = np.flatnonzero(self.registers).astype(np.uint16)
+        if nonzero.size * 3 < N_REGISTERS:
+            return (
+                struct.pack("<BH", _SPARSE, nonzero.size)
+                + nonzero.tobytes()
+                + self.registers[nonzero].tobytes()
+            )
+        return struct.pack("<B", _DENSE) + self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, blob):
+        """Deserialize a blob produced by to_bytes"""
+        blob = bytes(blob)
+        if blob[0] == _DENSE:
+            registers = np.frombuffer(blob, dtype=np.uint8, count=N_REGISTERS, offset=1).copy()
+            return cls(registers)
+        (n,) = struct.unpack_from("<H", blob, 1)
+        indices = np.frombuffer(blob, dtype=np.uint16, count=n, offset=3)
+        values = np.frombuffer(blob, dtype=np.uint8, count=n, offset=3 + 2 * n)
+        sketch = cls()
+        sketch.registers[indices] = values
+        return sketch
+
+
+class EngagementReach:
+    """Per-post and per-type daily unique engager sketches backed by DataStax.
+
+    Like the engagement distributions, every process owns its own rows
+    (keyed by its writer id) and queries merge all writers' rows for the range.
+    Only sketches with unflushed updates (and today's per-type sketches) stay
+    in memory; the rest are dropped once flushed and reloaded from this
+    writer's row when they are next touched.
+    """
+
+    def __init__(self, db, writer_id=None, flush_interval=FLUSH_INTERVAL):
+        self.db = db
+        self.writer_id = writer_id or get_writer_id()
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # Serializes flushes so an older copy of a row never overwrites a newer one
+        self._flush_lock = threading.Lock()
+        self._sketches = {}
+        self._dirty = set()
+        self._last_flush = time.monotonic()
+        # Bumped on every eviction, so a load that raced one is known to be stale
+        self._evictions = 0
+
+    def _load_many(self, keys, concurrency=100):
+        # Resume from our own rows, which hold everything flushed before eviction
+        blobs = self.db.get_writer_reach_sketches(keys, self.writer_id, concurrency)
+        return {
+            key: HyperLogLog.from_bytes(blobs[key]) if blobs.get(key) else HyperLogLog()
+            for key in keys
+        }
+
+    def record(self, user_ids, post_id, post_type, day):
+        """Record engagers of a post on a given day"""
+        self.record_many([(user_ids, post_id, post_type, day)])
+
+    def record_many(self, slots, concurrency=100):
+        """Record many (user_ids, post_id, post_type, day) slots, loading evicted sketches together"""
+        updates = {}
+        for user_ids, post_id, post_type, day in slots:
+            updates.setdefault(("post", post_id, day), []).extend(user_ids)
+            if post_type:
+                updates.setdefault(("type", post_type, day), []).extend(user_ids)
+        loaded = {}
+        while True:
+            with self._lock:
+                missing = [key for key in updates if key not in self._sketches and key not in loaded]
+                evictions = self._evictions
+            # Load outside the lock so a slow read doesn't stall other recorders
+            if missing:
+                loaded.update(self._load_many(missing, concurrency))
+            with self._lock:
+                if self._evictions != evictions:
+                    # A sketch may have been flushed and evicted since it was read: read again
+                    loaded = {}
+                    continue
+                for key, user_ids in updates.items():
+                    if key not in self._sketches:
+                        self._sketches[key] = loaded[key]
+                    self._sketches[key].add_many(user_ids)
+                    self._dirty.add(key)
+                due = time.monotonic() - self._last_flush >= self.flush_interval
+                break
+        if due:
+            self.flush(concurrency)
+
+    def flush(self, concurrency=100):
+        """Persist every sketch changed since the last flush, then drop the idle ones"""
+        with self._flush_lock:
+            with self._lock:
+                dirty = {key: self._sketches[key].to_bytes() for key in self._dirty}
+                self._dirty.clear()
+                self._last_flush = time.monotonic()
+            if not dirty:
+                return
+            failed = self.db.save_reach_sketches(
+                [(scope, name, day, self.writer_id, blob) for (scope, name, day), blob in dirty.items()],
+                concurrency
+            )
+            today = date.today()
+            with self._lock:
+                for key in dirty:
+                    if (*key, self.writer_id) in failed:
+                        self._dirty.add(key)
+                    elif key not in self._dirty and (key[0] == "post" or key[2] < today):
+                        # Persisted and not touched since: the row is as good as the sketch
+                        del self._sketches[key]
+                        self._evictions += 1
+        if failed:
+            print(f"Error saving {len(failed)} reach sketches; retrying on the next flush")
+
+    def unique_engagers(self, scope, key, start_date, end_date):
+        """Estimate distinct engagers for a post or post type over a date range"""
+        merged = HyperLogLog()
+        for row in self.db.get_reach_sketches(scope, key, start_date, end_date):
+            merged.merge(HyperLogLog.from_bytes(row["sketch"]))
+        # Include updates this process has not flushed yet
+        with self._lock:
+            day = start_date
+            while day <= end_date:
+                sketch = self._sketches.get((scope, key, day))
+                if sketch is not None:
+                    merged.merge(sketch)
+                day += timedelta(days=1)
+        return merged.count()
+
+
+def event_day(timestamp):
+    """Calendar day an engagement event falls on"""
+    if not isinstance(timestamp, datetime):
+        timestamp = datetime.fromisoformat(str(timestamp))
+    return date(timestamp.year, timestamp.month, timestamp.day)
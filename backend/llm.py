@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+
+
+class StubResponse:
+    """Minimal stand-in for a Gemini response"""
+
+    def __init__(self, text):
+        self.text = text
+
+
+class StubStreamResponse:
+    """Iterable of StubResponse chunks, like a Gemini response with stream=True"""
+
+    def __init__(self, text, latency, chunk_words=4):
+        words = text.split(" ")
+        self.chunks = [
+            " ".join(words[i:i + chunk_words]) + (" " if i + chunk_words < len(words) else "")
+            for i in range(0, len(words), chunk_words)
+        ]
+        self.latency = latency
+        self.text = text
+
+    def __iter__(self):
+        # Spread the latency over the chunks so the first one arrives early
+        for chunk in self.chunks:
+            time.sleep(self.latency / len(self.chunks))
+            yield StubResponse(chunk)
+
+
+class StubModel:
+    """Drop-in replacement for GenerativeModel with a fixed, configurable latency"""
+
+    def __init__(self, latency=None, text="Stub analysis."):
+        if latency is None:
+            latency = float(os.getenv("LLM_STUB_LATENCY", "0.5"))
+        self.latency = latency
+        self.text = text
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        if stream:
+            return StubStreamResponse(self.text, self.latency)
+        time.sleep(self.latency)
+        return StubResponse(self.text)
+
+
+def create_model(backend=None):
+    """Create the configured text generation model (LLM_BACKEND: "gemini" or "stub")"""
+    backend = backend or os.getenv("LLM_BACKEND", "gemini")
+    if backend == "stub":
+        return StubModel()
+    if backend == "gemini":
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        return genai.GenerativeModel('gemini-pro')
+    raise ValueError(f"Unknown LLM backend: {backend}")
+
+
+class LazyModel:
+    """Defers create_model() (and importing the Gemini SDK) until first use"""
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = create_model(self.backend)
+        return self._model
+
+    def generate_content(self, *args, **kwargs):
+        return self._get().generate_content(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        return getattr(self._get(), attr)
@@ -1,31 +1,47 @@
-from fastapi import FastAPI, HTTPException
+import time
+_import_started = time.perf_counter()
+
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import FastAPI, HTTPException, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 import json
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import random
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse, Response, JSONResponse
 import os
-import google.generativeai as genai
 from dotenv import load_dotenv
 from fastapi import UploadFile, File
 from io import BytesIO
-import pandas as pd
-from plotly import graph_objects as go
-import plotly.express as px
-from plotly.subplots import make_subplots
 import base64
 from io import BytesIO
-from datastax_service import DataStaxService
-from db_config import init_database
+import numpy as np
+from storage import create_storage
+from llm import LazyModel
+from readiness import Readiness, ReadinessMiddleware
+from prediction_engine import PerformancePredictor, parse_time_of_day
+from quantile_sketch import EngagementDistributions
+from event_ingest import EventBatch, ingest_batch, merge_results, parse_ndjson_line, NDJSON_CHUNK_SIZE
+from shared_aggregates import SharedAggregates, compute_cells, hourly_means, AGGREGATE_REFRESH_SECONDS
+from snapshot import Snapshot
+from scheduler import Scheduler, Job
+from similarity import SimilarityIndex
+from posts import PostRecord, POST_FIELDS, POST_TYPES, ORJSONResponse, parse_fields
+import figures
+from starlette.concurrency import run_in_threadpool, iterate_in_threadpool
+from metrics import (
+    REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE, InstrumentedModel, MetricsMiddleware,
+    INGEST_QUEUE_DEPTH, INGEST_EVENTS, STARTUP_DURATION, IMPORT_DURATION
+)
 
 # Load environment variables
 load_dotenv()
 
-# Configure Gemini AI
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel('gemini-pro')
+# Configure Gemini AI on first use (LLM_BACKEND=stub swaps in a fixed-latency stand-in)
+model = InstrumentedModel(LazyModel())
 
 # Initialize FastAPI app
 app = FastAPI()
@@ -39,28 +55,222 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Answer 503 until background initialization has finished
+readiness = Readiness()
+app.add_middleware(ReadinessMiddleware, readiness=readiness)
+
+# Record per-route latency for /metrics
+app.add_middleware(MetricsMiddleware)
+
 # Initialize DataStax connection
 db = None
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize database connection on startup"""
-    global db
+# Local engagement prediction model
+predictor = None
+
+# Per post type engagement distribution sketches
+distributions = None
+
+# Per type/hour engagement sums shared by every worker on the host
+aggregates = None
+aggregate_refresh_task = None
+
+# Memory-mapped columnar snapshot of the posts table
+snapshot = None
+
+# Content similarity index over posts, for /posts/{post_id}/similar and prompt context
+similarity = None
+
+# Background jobs precomputing the AI reports and trend rollups
+reports = None
+
+# Pool for CPU-bound figure building, started during initialization
+FIGURE_WORKERS = int(os.getenv("FIGURE_WORKERS", "2"))
+figure_pool = None
+
+def get_figure_pool():
+    """Create the figure process pool (spawned, so workers never inherit a Cassandra session)"""
+    global figure_pool
+    if figure_pool is None:
+        figure_pool = ProcessPoolExecutor(
+            max_workers=FIGURE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=figures.preload
+        )
+    return figure_pool
+
+async def run_cpu(fn, *args):
+    """Run a CPU-bound function in the process pool without blocking the event loop"""
+    return await asyncio.get_running_loop().run_in_executor(get_figure_pool(), fn, *args)
+
+def refresh_aggregates():
+    """Bring the shared aggregates up to date if this worker holds the refresher role.
+
+    The aggregates come from the snapshot plus the posts changed since its
+    high-water mark. The snapshot keeps a replay cursor, so each refresh only
+    fetches the posts changed since the previous one, and only a stale or
+    missing snapshot costs a full (paged) scan. The prediction model is
+    trained on that same scan and caught up from the same changes. Other
+    workers just pick up the latest snapshot and model.
+    """
+    global snapshot
+    if not aggregates.try_become_refresher():
+        snapshot = Snapshot.load(current=snapshot)
+        predictor.reload()
+        return
+    snapshot = Snapshot.load(current=snapshot)
+    if snapshot is None or snapshot.is_stale() or predictor.high_water_mark != snapshot.high_water_mark:
+        high_water_mark = int(time.time() * 1000)
+        trained = PerformancePredictor(predictor.alpha, predictor.path)
+        snapshot = Snapshot.write(db, high_water_mark=high_water_mark, on_page=trained.accumulate)
+        predictor.adopt(trained, snapshot.high_water_mark)
+    changed_posts = snapshot.catch_up(db)
+    predictor.catch_up(changed_posts, snapshot)
+    if predictor.unsaved:
+        # Includes posts this worker folded in itself
+        predictor.save()
+    aggregates.publish(snapshot.replay())
+
+def refresh_similarity():
+    """Pick up posts saved by the other workers.
+
+    Like the prediction model, the index file is written only by the
+    refreshing worker; the others reload it before catching up.
+    """
+    if aggregates.is_refresher:
+        similarity.catch_up(db)
+        if similarity.unsaved:
+            similarity.save()
+    else:
+        similarity.reload()
+        similarity.catch_up(db)
+
+async def aggregate_refresh_loop():
+    """Periodically rebuild the shared aggregates (only one worker per host does the work)"""
+    # initialize() does the first refresh; don't overlap it or run without it
+    await readiness.wait()
+    if not readiness.ready:
+        return
+    while True:
+        await asyncio.sleep(AGGREGATE_REFRESH_SECONDS)
+        try:
+            await run_in_threadpool(refresh_aggregates)
+        except Exception as e:
+            print(f"Error refreshing shared aggregates: {str(e)}")
+        try:
+            await run_in_threadpool(refresh_similarity)
+        except Exception as e:
+            print(f"Error updating similarity index: {str(e)}")
+
+# How often a worker starting up checks for the refresher's model and similarity index files
+REFRESHER_POLL_SECONDS = 1.0
+
+def wait_for_refresher():
+    """Wait for the refresher's model and similarity index files instead of scanning the posts.
+
+    Returns once both are usable, or once this worker holds the refresher
+    role itself (the previous holder exited), in which case refresh_aggregates
+    has trained the model and the caller builds the index.
+    """
+    waiting = False
+    while not aggregates.is_refresher:
+        if similarity.reload() and not similarity.is_stale():
+            similarity.catch_up(db)
+        index_ready = similarity.high_water_mark is not None and not similarity.is_stale()
+        if predictor.high_water_mark is not None and index_ready:
+            return
+        if not waiting:
+            print("Waiting for the refreshing worker's prediction model and similarity index")
+            waiting = True
+        time.sleep(REFRESHER_POLL_SECONDS)
+        refresh_aggregates()
+
+def initialize():
+    """Connect to the database and load analytics state (runs in a worker thread)"""
+    global db, predictor, distributions, aggregates, reports, similarity
+    started = time.perf_counter()
     try:
-        db = DataStaxService()
+        db = create_storage()
         print("Database connection established")
     except Exception as e:
         print(f"Error connecting to database: {str(e)}")
         raise
 
+    predictor = PerformancePredictor()
+    if predictor.load():
+        print(f"Prediction model loaded ({predictor.n_samples} posts)")
+
+    distributions = EngagementDistributions(db)
+    if not db.has_engagement_sketches():
+        distributions.backfill(db.get_all_posts())
+        print("Engagement distribution sketches backfilled")
+    
+    aggregates = SharedAggregates()
+    similarity = SimilarityIndex()
+    refresh_aggregates()
+    if similarity.load() and not similarity.is_stale():
+        similarity.catch_up(db)
+        print(f"Similarity index loaded ({len(similarity)} posts)")
+    wait_for_refresher()
+    if similarity.high_water_mark is None or similarity.is_stale():
+        similarity.fit(db.get_all_posts())
+        similarity.save()
+        print(f"Similarity index built over {len(similarity)} posts")
+    
+    reports = create_scheduler()
+    
+    # Start the figure workers in the background rather than on the first /visualize request
+    pool = get_figure_pool()
+    for _ in range(FIGURE_WORKERS):
+        pool.submit(time.sleep, 0.1)
+    
+    STARTUP_DURATION.set(time.perf_counter() - started)
+
+@app.on_event("startup")
+async def startup_event():
+    """Start initialization in the background so the server accepts connections immediately"""
+    global aggregate_refresh_task
+    readiness.start(asyncio.create_task(run_in_threadpool(initialize)))
+    aggregate_refresh_task = asyncio.create_task(aggregate_refresh_loop())
+    asyncio.create_task(start_report_jobs())
+
 @app.on_event("shutdown")
 async def shutdown_event():
     """Close database connection on shutdown"""
     global db
+    await readiness.wait()
+    if aggregate_refresh_task:
+        aggregate_refresh_task.cancel()
+    if reports:
+        reports.stop()
+    if figure_pool:
+        figure_pool.shutdown()
+    if similarity and aggregates.is_refresher and similarity.unsaved:
+        similarity.save()
     if db:
         db.close()
         print("Database connection closed")
 
+def create_scheduler():
+    """Background jobs for the reports that only depend on slowly changing aggregates"""
+    scheduler = Scheduler(db)
+    scheduler.add(Job("performance_analysis", all_type_analytics, compute_performance_analysis))
+    scheduler.add(Job("content_calendar", all_type_analytics, compute_content_calendar))
+    scheduler.add(Job("analyze_audience", audience_inputs, compute_audience_analysis))
+    scheduler.add(Job("engagement_trends", engagement_trends, compute_engagement_trends))
+    return scheduler
+
+async def start_report_jobs():
+    """Start the report jobs once initialization has succeeded"""
+    await readiness.wait()
+    if readiness.ready:
+        reports.start()
+
+async def generate_text(prompt):
+    """Gemini text for a prompt, generated in the threadpool"""
+    response = await run_in_threadpool(model.generate_content, prompt)
+    return response.text
+
 class Post(BaseModel):
     id: str
     type: str
@@ -74,52 +284,243 @@ class Post(BaseModel):
 class BatchPostInput(BaseModel):
     posts: List[Post]
 
+class PredictionCandidate(BaseModel):
+    type: str
+    time_of_day: str
+    content: Optional[str] = None
+
+class BatchPredictionInput(BaseModel):
+    candidates: List[PredictionCandidate]
+    confidence: float = 0.95
+
 @app.get("/")
 async def read_root():
     return {"message": "Social Media Analytics API"}
 
+@app.get("/ready")
+async def get_ready():
+    """Readiness probe: 200 once the database and analytics state are loaded"""
+    status = readiness.status()
+    return JSONResponse(status, status_code=200 if status["status"] == "ready" else 503)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Expose metrics in the Prometheus text format"""
+    return Response(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+# Largest page GET /posts will return
+MAX_PAGE_SIZE = 1000
+
 @app.get("/posts")
-async def get_posts():
-    posts = db.get_all_posts()
-    return posts
+async def get_posts(
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    post_type: Optional[str] = Query(None, alias="type"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    min_engagement: Optional[int] = None,
+    fields: Optional[str] = None
+):
+    """
+    List posts a page at a time.
+    Filters: type, start/end (post timestamp, ISO 8601) and min_engagement
+    (likes + shares + comments). fields=id,type,likes selects only those
+    columns. Pass the returned `next` token as cursor to get the following
+    page; it is null on the last page. A filtered page can hold fewer than
+    limit posts (even none) while `next` is still set.
+    """
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    if min_engagement is not None and min_engagement < 0:
+        raise HTTPException(status_code=400, detail="min_engagement must not be negative")
+    start, end = to_utc_naive(start), to_utc_naive(end)
+    if start is not None and end is not None and start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    try:
+        selected = parse_fields(fields)
+        paging_state = decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        posts, next_state = db.get_posts_page(
+            limit, paging_state, post_type, start, end, min_engagement, selected
+        )
+    except ValueError as e:
+        # The backend rejected the cursor (e.g. it belongs to a different query)
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return ORJSONResponse({"posts": posts, "next": encode_cursor(next_state)})
+
+def encode_cursor(paging_state):
+    """Opaque, URL-safe page token for a backend paging state"""
+    return base64.urlsafe_b64encode(paging_state).rstrip(b"=").decode() if paging_state else None
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        return base64.b64decode(
+            cursor.encode() + b"=" * (-len(cursor) % 4), altchars=b"-_", validate=True
+        ) or None
+    except ValueError:
+        raise ValueError("Invalid cursor") from None
+
+def to_utc_naive(value):
+    """Stored timestamps are naive UTC; convert aware query bounds to match"""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+@app.get("/analytics/trends")
+async def get_trends(fresh: bool = False):
+    """Get engagement trends from DataStax (precomputed by the engagement_trends job)"""
+    try:
+        report = await reports.latest("engagement_trends", fresh=fresh)
+        return report.result["trends"]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def engagement_trends():
+    return {"trends": await run_in_threadpool(lambda: list(db.get_engagement_trends()))}
+
+async def compute_engagement_trends(inputs):
+    # The rollup is its own input; the job just keeps the latest copy
+    return inputs
 
 @app.get("/analytics/{post_type}")
 async def get_analytics(post_type: str):
-    filtered_posts = db.get_posts_by_type(post_type)
-    if not filtered_posts:
+    return analytics_summary(type_averages(post_type))
+
+def analytics_summary(averages):
+    """The /analytics/{post_type} shape for type_averages() output"""
+    if averages is None:
         return {
             "average_likes": 0,
             "average_shares": 0,
             "average_comments": 0
         }
     
-    avg_likes = sum(post["likes"] for post in filtered_posts) / len(filtered_posts)
-    avg_shares = sum(post["shares"] for post in filtered_posts) / len(filtered_posts)
-    avg_comments = sum(post["comments"] for post in filtered_posts) / len(filtered_posts)
+    return {
+        "average_likes": averages["likes"],
+        "average_shares": averages["shares"],
+        "average_comments": averages["comments"]
+    }
+
+def type_averages(post_type):
+    """Average likes/shares/comments for a post type, or None if it has no posts"""
+    averages = aggregates.type_averages(post_type)
+    if averages is not None:
+        return averages if averages["count"] else None
+    
+    # Shared aggregates not built yet, or a type they don't track: scan the posts
+    filtered_posts = db.get_posts_by_type(post_type)
+    if not filtered_posts:
+        return None
     
     return {
-        "average_likes": avg_likes,
-        "average_shares": avg_shares,
-        "average_comments": avg_comments
+        "count": len(filtered_posts),
+        "likes": sum(post["likes"] for post in filtered_posts) / len(filtered_posts),
+        "shares": sum(post["shares"] for post in filtered_posts) / len(filtered_posts),
+        "comments": sum(post["comments"] for post in filtered_posts) / len(filtered_posts)
     }
 
-@app.get("/performance-analysis")
-async def get_performance_analysis():
-    # Get analytics for each post type
-    post_types = ["carousel", "reel", "static"]
-    analytics = {}
+@app.get("/analytics/{post_type}/distribution")
+async def get_analytics_distribution(
+    post_type: str,
+    quantiles: str = "0.5,0.9,0.95,0.99",
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None
+):
+    """
+    Get percentiles of likes, shares, comments and total engagement for a post type.
+    Answered from merged per-day quantile sketches, so the cost does not grow
+    with the number of posts. Each post counts with the engagement it had when
+    it was created or imported; later engagement events don't move it.
+    """
+    try:
+        qs = [float(q) for q in quantiles.split(",") if q.strip()]
+        start = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else None
+        end = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid parameter: {str(e)}")
+    if not qs or any(not 0 <= q <= 1 for q in qs):
+        raise HTTPException(status_code=400, detail="quantiles must be between 0 and 1")
     
-    for post_type in post_types:
-        analytics[post_type] = await get_analytics(post_type)
+    return {
+        "post_type": post_type,
+        "start_date": start_date,
+        "end_date": end_date,
+        "distribution": distributions.distribution(post_type, qs, start, end)
+    }
+
+@app.get("/analytics/{post_type}/reach")
+async def get_type_reach(post_type: str, start_date: Optional[str] = None, end_date: Optional[str] = None):
+    """
+    Estimate unique engagers for a post type over a date range (default: last 7 days).
+    """
+    start, end = parse_date_range(start_date, end_date)
+    return {
+        "post_type": post_type,
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "unique_engagers": db.reach.unique_engagers("type", post_type, start, end)
+    }
+
+@app.get("/performance-analysis")
+async def get_performance_analysis(fresh: bool = False):
+    """
+    Performance comparison with Gemini's analysis, as last precomputed by the
+    performance_analysis job; fresh=true recomputes it now.
+    """
+    try:
+        report = await reports.latest("performance_analysis", fresh=fresh)
+    except Exception as e:
+        analytics = await all_type_analytics()
+        return {
+            "analytics": analytics,
+            "engagement_rates": compute_engagement_rates(analytics),
+            "ai_analysis": "Error generating AI analysis. Please try again later."
+        }
     
-    # Calculate engagement rates
+    return {**report.result, "computed_at": report.computed_at}
+
+async def all_type_analytics():
+    # Get analytics for each post type
+    return {post_type: await get_analytics(post_type) for post_type in POST_TYPES}
+
+async def compute_performance_analysis(analytics):
+    engagement_rates = compute_engagement_rates(analytics)
+    return {
+        "analytics": analytics,
+        "engagement_rates": engagement_rates,
+        "ai_analysis": await generate_text(performance_analysis_prompt(analytics, engagement_rates))
+    }
+
+@app.get("/performance-analysis/stream")
+async def stream_performance_analysis():
+    """
+    Streaming /performance-analysis: the analytics and engagement rates first,
+    then the AI analysis as it is generated (see stream_ai_text).
+    """
+    analytics = {post_type: await get_analytics(post_type) for post_type in POST_TYPES}
+    engagement_rates = compute_engagement_rates(analytics)
+    return stream_ai_text(
+        {"analytics": analytics, "engagement_rates": engagement_rates},
+        performance_analysis_prompt(analytics, engagement_rates)
+    )
+
+def compute_engagement_rates(analytics):
+    """Mean of average likes, shares and comments per post type"""
     engagement_rates = {}
     for post_type, metrics in analytics.items():
         engagement_rate = (metrics["average_likes"] + metrics["average_shares"] + metrics["average_comments"]) / 3
         engagement_rates[post_type] = engagement_rate
-    
+    return engagement_rates
+
+def performance_analysis_prompt(analytics, engagement_rates):
     # Prepare data for Gemini analysis
-    analysis_prompt = f"""
+    return f"""
     Analyze the performance of different post types on social media with the following metrics:
     
     Carousel Posts:
@@ -146,18 +547,6 @@ async def get_performance_analysis():
     3. Key insights about engagement patterns
     4. Suggestions for improvement
     """
-    
-    try:
-        response = model.generate_content(analysis_prompt)
-        ai_analysis = response.text
-    except Exception as e:
-        ai_analysis = "Error generating AI analysis. Please try again later."
-    
-    return {
-        "analytics": analytics,
-        "engagement_rates": engagement_rates,
-        "ai_analysis": ai_analysis
-    }
 
 @app.get("/insights/{post_type}")
 async def get_insights(post_type: str):
@@ -167,6 +556,9 @@ async def get_insights(post_type: str):
 
 @app.get("/time-analytics")
 async def get_time_analytics():
+    return time_analytics()
+
+def time_analytics():
     time_periods = ['Morning', 'Afternoon', 'Evening']
     time_data = []
     for period in time_periods:
@@ -181,6 +573,9 @@ async def get_time_analytics():
 
 @app.get("/trending-hashtags")
 async def get_trending_hashtags():
+    return trending_hashtags()
+
+def trending_hashtags():
     hashtags = [
         {"tag": "#digitalmarketing", "count": random.randint(100, 1000)},
         {"tag": "#socialmedia", "count": random.randint(100, 1000)},
@@ -193,20 +588,24 @@ async def get_trending_hashtags():
 @app.post("/posts")
 async def create_post(post: Post):
     """Create a new post with DataStax integration"""
-    post_dict = post.dict()
-    db.save_post(post_dict)
+    record = PostRecord.from_model(post)
+    db.save_post(record)
+    predictor.partial_fit([record])
+    similarity.add([record])
+    await run_in_threadpool(distributions.record_posts, [record])
+    aggregates.add_posts([record])
     
     # Calculate initial engagement metrics
     total_engagement = post.likes + post.shares + post.comments
     
     # Save initial analytics
     db.save_analytics(
-        post_dict["id"],
+        record.id,
         total_engagement,
         0.0  # Initial neutral sentiment score
     )
     
-    return {"message": "Post created successfully", "post": post_dict}
+    return ORJSONResponse({"message": "Post created successfully", "post": record})
 
 @app.get("/posts/{post_id}")
 async def get_post(post_id: str):
@@ -214,7 +613,133 @@ async def get_post(post_id: str):
     post = db.get_post(post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
-    return post
+    return ORJSONResponse(post)
+
+MAX_SIMILAR_POSTS = 100
+
+@app.get("/posts/{post_id}/similar")
+async def get_similar_posts(post_id: str, k: int = 10, post_type: Optional[str] = Query(None, alias="type")):
+    """Posts whose content is most similar to this one (optionally of one type), with their engagement"""
+    if not 1 <= k <= MAX_SIMILAR_POSTS:
+        raise HTTPException(status_code=400, detail=f"k must be between 1 and {MAX_SIMILAR_POSTS}")
+    post = db.get_post(post_id)
+    if not post:
+        raise HTTPException(status_code=404, detail="Post not found")
+    
+    similar = await run_in_threadpool(similar_posts, post["content"], k, post_type, post_id)
+    return ORJSONResponse({"post_id": post_id, "similar": similar})
+
+def similar_posts(content, k=5, post_type=None, exclude=None):
+    """The k posts nearest to content, as post dicts with a similarity score"""
+    matches = similarity.search(content, k, post_type=post_type, exclude=exclude)
+    # Engagement comes from the database so it is current
+    posts = {post.id: post for post in db.get_posts([post_id for post_id, _ in matches])}
+    return [
+        {**posts[post_id].to_dict(), "similarity": score}
+        for post_id, score in matches if post_id in posts
+    ]
+
+def similar_posts_prompt(posts):
+    """Prompt section listing similar historical posts and how they performed"""
+    if not posts:
+        return ""
+    lines = [
+        f"    - [{post['type']}] \"{(post['content'] or '')[:200]}\" "
+        f"(Likes: {post['likes']}, Shares: {post['shares']}, Comments: {post['comments']})"
+        for post in posts
+    ]
+    return "\n    Similar historical posts and their actual performance:\n" + "\n".join(lines) + "\n"
+
+@app.get("/posts/{post_id}/reach")
+async def get_post_reach(post_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None):
+    """
+    Estimate unique engagers for a post over a date range (default: last 7 days).
+    """
+    start, end = parse_date_range(start_date, end_date)
+    return {
+        "post_id": post_id,
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "unique_engagers": db.reach.unique_engagers("post", post_id, start, end)
+    }
+
+@app.get("/users/{user_id}/engagement")
+async def get_user_engagement(user_id: str, limit: int = 100):
+    """Get a user's engagement history, newest first"""
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return list(db.get_user_engagement_history(user_id, limit))
+
+@app.post("/engagement/events")
+async def ingest_engagement_events(request: Request):
+    """
+    Bulk ingest of like/share/comment events.
+    Accepts columnar JSON (parallel arrays), NDJSON (one event per line,
+    streamed and written in chunks) or an Arrow IPC stream.
+    Timestamps are ISO 8601 strings or epoch milliseconds; server time is
+    used when they are omitted. Events for unknown posts are rejected.
+    Only failed_rows (none of their counts applied) are safe to retry.
+    Example (application/json):
+    {
+        "user_id": ["u1", "u2"],
+        "post_id": ["7", "7"],
+        "engagement_type": ["like", "comment"],
+        "timestamp": ["2024-12-31T14:00:00", 1735653600000]
+    }
+    """
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip()
+    
+    try:
+        if content_type in ("application/x-ndjson", "application/jsonl"):
+            total = {
+                "accepted": 0, "rejected": 0, "rejected_rows": [],
+                "failed": 0, "failed_rows": [], "rollup_failed": 0
+            }
+            records = []
+            offset = 0
+            buffer = b""
+            async for chunk in request.stream():
+                buffer += chunk
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    record = parse_ndjson_line(line)
+                    if record is not None:
+                        records.append(record)
+                if len(records) >= NDJSON_CHUNK_SIZE:
+                    result = await run_ingest(EventBatch.from_records(records))
+                    merge_results(total, result, offset)
+                    offset += len(records)
+                    records = []
+            record = parse_ndjson_line(buffer)
+            if record is not None:
+                records.append(record)
+            if records:
+                result = await run_ingest(EventBatch.from_records(records))
+                merge_results(total, result, offset)
+            return total
+        
+        body = await request.body()
+        if content_type == "application/vnd.apache.arrow.stream":
+            batch = EventBatch.from_arrow(body)
+        else:
+            batch = EventBatch.from_columns(json.loads(body))
+    except (ValueError, TypeError, AttributeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid event batch: {str(e)}")
+    
+    return await run_ingest(batch)
+
+async def run_ingest(batch):
+    """Write an event batch off the event loop, tracking the ingest queue depth"""
+    INGEST_QUEUE_DEPTH.inc(len(batch))
+    try:
+        result = await run_in_threadpool(ingest_batch, db, batch)
+    finally:
+        INGEST_QUEUE_DEPTH.dec(len(batch))
+    INGEST_EVENTS.labels("accepted").inc(result["accepted"])
+    INGEST_EVENTS.labels("rejected").inc(result["rejected"])
+    INGEST_EVENTS.labels("failed").inc(result["failed"])
+    INGEST_EVENTS.labels("rollup_failed").inc(result["rollup_failed"])
+    return result
 
 @app.get("/analytics/performance/{post_type}")
 async def get_type_performance(
@@ -232,15 +757,6 @@ async def get_type_performance(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/analytics/trends")
-async def get_trends():
-    """Get engagement trends from DataStax"""
-    try:
-        trends_data = db.get_engagement_trends()
-        return list(trends_data)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
 @app.get("/sentiment-analysis/{post_id}")
 async def get_sentiment_analysis(post_id: str):
     # Find the post
@@ -253,8 +769,41 @@ async def get_sentiment_analysis(post_id: str):
     if not comments:
         return {"message": "No comments to analyze"}
     
+    try:
+        response = model.generate_content(sentiment_analysis_prompt(post, comments))
+        sentiment_analysis = response.text
+    except Exception as e:
+        sentiment_analysis = "Error generating sentiment analysis. Please try again later."
+    
+    return {
+        "post_type": post["type"],
+        "content": post["content"],
+        "comment_count": len(comments),
+        "sentiment_analysis": sentiment_analysis
+    }
+
+@app.get("/sentiment-analysis/{post_id}/stream")
+async def stream_sentiment_analysis(post_id: str):
+    """
+    Streaming /sentiment-analysis/{post_id}: the post summary first, then the
+    AI sentiment analysis as it is generated (see stream_ai_text).
+    """
+    post = db.get_post(post_id)
+    if not post:
+        raise HTTPException(status_code=404, detail="Post not found")
+    
+    comments = post.get("comment_list", [])
+    if not comments:
+        return {"message": "No comments to analyze"}
+    
+    return stream_ai_text(
+        {"post_type": post["type"], "content": post["content"], "comment_count": len(comments)},
+        sentiment_analysis_prompt(post, comments)
+    )
+
+def sentiment_analysis_prompt(post, comments):
     # Prepare prompt for Gemini
-    analysis_prompt = f"""
+    return f"""
     Analyze the sentiment and key themes in these comments for a {post['type']} post about "{post['content']}":
 
     Comments:
@@ -269,32 +818,44 @@ async def get_sentiment_analysis(post_id: str):
     
     Format the response in a clear, structured way.
     """
-    
+
+@app.get("/content-calendar")
+async def get_content_calendar(fresh: bool = False):
+    """
+    Content calendar recommendations, as last precomputed by the
+    content_calendar job; fresh=true recomputes them now.
+    """
     try:
-        response = model.generate_content(analysis_prompt)
-        sentiment_analysis = response.text
+        report = await reports.latest("content_calendar", fresh=fresh)
     except Exception as e:
-        sentiment_analysis = "Error generating sentiment analysis. Please try again later."
+        return {
+            "performance_data": await all_type_analytics(),
+            "calendar_recommendations": "Error generating recommendations. Please try again later."
+        }
     
+    return {**report.result, "computed_at": report.computed_at}
+
+async def compute_content_calendar(performance_data):
     return {
-        "post_type": post["type"],
-        "content": post["content"],
-        "comment_count": len(comments),
-        "sentiment_analysis": sentiment_analysis
+        "performance_data": performance_data,
+        "calendar_recommendations": await generate_text(content_calendar_prompt(performance_data))
     }
 
-@app.get("/content-calendar")
-async def get_content_calendar():
-    # Analyze existing post performance
-    post_types = ["carousel", "reel", "static"]
-    performance_data = {}
-    
-    for post_type in post_types:
-        analytics = await get_analytics(post_type)
-        performance_data[post_type] = analytics
-    
+@app.get("/content-calendar/stream")
+async def stream_content_calendar():
+    """
+    Streaming /content-calendar: the performance data first, then the AI
+    calendar recommendations as they are generated (see stream_ai_text).
+    """
+    performance_data = {post_type: await get_analytics(post_type) for post_type in POST_TYPES}
+    return stream_ai_text(
+        {"performance_data": performance_data},
+        content_calendar_prompt(performance_data)
+    )
+
+def content_calendar_prompt(performance_data):
     # Prepare prompt for content calendar recommendations
-    calendar_prompt = f"""
+    return f"""
     Based on this performance data for different post types:
 
     {json.dumps(performance_data, indent=2)}
@@ -308,17 +869,6 @@ async def get_content_calendar():
     
     Consider current engagement rates and platform best practices.
     """
-    
-    try:
-        response = model.generate_content(calendar_prompt)
-        calendar_recommendations = response.text
-    except Exception as e:
-        calendar_recommendations = "Error generating recommendations. Please try again later."
-    
-    return {
-        "performance_data": performance_data,
-        "calendar_recommendations": calendar_recommendations
-    }
 
 @app.post("/batch-posts")
 async def create_batch_posts(batch: BatchPostInput):
@@ -352,14 +902,19 @@ async def create_batch_posts(batch: BatchPostInput):
     """
     added_posts = []
     for post in batch.posts:
-        post_dict = post.dict()
-        db.save_post(post_dict)
-        added_posts.append(post_dict)
+        record = PostRecord.from_model(post)
+        db.save_post(record)
+        added_posts.append(record)
     
-    return {
+    predictor.partial_fit(added_posts)
+    similarity.add(added_posts)
+    await run_in_threadpool(distributions.record_posts, added_posts)
+    aggregates.add_posts(added_posts)
+    
+    return ORJSONResponse({
         "message": f"Successfully added {len(added_posts)} posts",
         "added_posts": added_posts
-    }
+    })
 
 @app.post("/import-csv")
 async def import_csv(file: UploadFile = File(...)):
@@ -368,38 +923,50 @@ async def import_csv(file: UploadFile = File(...)):
     CSV should have headers:
     id,type,likes,shares,comments,timestamp,content
     """
+    import pandas as pd
     try:
         contents = await file.read()
-        df = pd.read_csv(BytesIO(contents))
+        df = pd.read_csv(BytesIO(contents), dtype={"id": str, "content": str})
+        # A blank cell reads as NaN; store a post without content instead
+        content = df["content"].astype(object).where(df["content"].notna(), None)
+        # Stored timestamps are naive UTC, as in PostRecord.from_model; naive cells are taken as UTC
+        timestamps = pd.to_datetime(df["timestamp"], utc=True, format="ISO8601").dt.tz_localize(None)
         
         # Convert DataFrame to posts
         new_posts = []
-        for _, row in df.iterrows():
-            post = {
-                "id": str(row["id"]),
-                "type": row["type"],
-                "likes": int(row["likes"]),
-                "shares": int(row["shares"]),
-                "comments": int(row["comments"]),
-                "timestamp": row["timestamp"],
-                "content": row["content"],
-                "comment_list": []  # Initialize empty comment list for imported posts
-            }
+        columns = zip(
+            df["id"].astype(str).tolist(),
+            df["type"].tolist(),
+            content.tolist(),
+            df["likes"].astype(int).tolist(),
+            df["shares"].astype(int).tolist(),
+            df["comments"].astype(int).tolist(),
+            [timestamp.to_pydatetime() for timestamp in timestamps]
+        )
+        for post_id, post_type, content, likes, shares, comments, timestamp in columns:
+            # Imported posts start with an empty comment list
+            post = PostRecord(post_id, post_type, content, likes, shares, comments, timestamp, [])
             db.save_post(post)
             new_posts.append(post)
         
-        return {
+        predictor.partial_fit(new_posts)
+        similarity.add(new_posts)
+        await run_in_threadpool(distributions.record_posts, new_posts)
+        aggregates.add_posts(new_posts)
+        
+        return ORJSONResponse({
             "message": f"Successfully imported {len(new_posts)} posts from CSV",
             "imported_posts": new_posts
-        }
+        })
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error importing CSV: {str(e)}")
 
 @app.get("/export-csv")
 async def export_csv():
     """Export all posts to CSV format"""
+    import pandas as pd
     posts = db.get_all_posts()
-    df = pd.DataFrame(posts)
+    df = pd.DataFrame([post.to_dict() for post in posts], columns=list(POST_FIELDS))
     
     # Create CSV in memory
     output = BytesIO()
@@ -427,8 +994,46 @@ async def optimize_content(post_id: str):
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
+    similar = await run_in_threadpool(similar_posts, post["content"], 5, None, post_id)
+    
+    try:
+        response = model.generate_content(optimization_prompt(post, similar))
+        optimization_analysis = response.text
+        
+        return {
+            "post_id": post_id,
+            "post_type": post["type"],
+            "original_content": post["content"],
+            "similar_posts": similar,
+            "optimization_suggestions": optimization_analysis
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating optimization suggestions: {str(e)}")
+
+@app.get("/optimize-content/{post_id}/stream")
+async def stream_optimize_content(post_id: str):
+    """
+    Streaming /optimize-content/{post_id}: the post first, then the AI
+    optimization suggestions as they are generated (see stream_ai_text).
+    """
+    post = db.get_post(post_id)
+    if not post:
+        raise HTTPException(status_code=404, detail="Post not found")
+    
+    similar = await run_in_threadpool(similar_posts, post["content"], 5, None, post_id)
+    return stream_ai_text(
+        {
+            "post_id": post_id,
+            "post_type": post["type"],
+            "original_content": post["content"],
+            "similar_posts": similar
+        },
+        optimization_prompt(post, similar)
+    )
+
+def optimization_prompt(post, similar=()):
     # Prepare prompt for content optimization
-    optimization_prompt = f"""
+    return f"""
     Analyze this social media post and provide content optimization suggestions:
 
     Post Type: {post['type']}
@@ -437,7 +1042,7 @@ async def optimize_content(post_id: str):
     - Likes: {post['likes']}
     - Shares: {post['shares']}
     - Comments: {post['comments']}
-
+    {similar_posts_prompt(similar)}
     Please provide:
     1. Content Strengths: What works well in this post
     2. Areas for Improvement: Specific suggestions to enhance engagement
@@ -445,19 +1050,6 @@ async def optimize_content(post_id: str):
     4. Call-to-Action: Suggestions for better engagement
     5. Visual Elements: Recommendations for {post['type']} format
     """
-    
-    try:
-        response = model.generate_content(optimization_prompt)
-        optimization_analysis = response.text
-        
-        return {
-            "post_id": post_id,
-            "post_type": post["type"],
-            "original_content": post["content"],
-            "optimization_suggestions": optimization_analysis
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generating optimization suggestions: {str(e)}")
 
 @app.get("/generate-hashtags")
 async def generate_hashtags(content: str, category: str = "general"):
@@ -493,27 +1085,54 @@ async def generate_hashtags(content: str, category: str = "general"):
         raise HTTPException(status_code=500, detail=f"Error generating hashtags: {str(e)}")
 
 @app.get("/analyze-audience")
-async def analyze_audience():
+async def analyze_audience(fresh: bool = False):
     """
     Analyze audience behavior and engagement patterns using Gemini AI.
+    Served from the analyze_audience job's last run; fresh=true recomputes it now.
     """
-    # Calculate engagement metrics for analysis
-    engagement_data = {}
-    post_types = ["carousel", "reel", "static"]
-    
-    for post_type in post_types:
-        filtered_posts = db.get_posts_by_type(post_type)
-        if filtered_posts:
-            avg_likes = sum(post["likes"] for post in filtered_posts) / len(filtered_posts)
-            avg_shares = sum(post["shares"] for post in filtered_posts) / len(filtered_posts)
-            avg_comments = sum(post["comments"] for post in filtered_posts) / len(filtered_posts)
-            engagement_data[post_type] = {
-                "avg_likes": avg_likes,
-                "avg_shares": avg_shares,
-                "avg_comments": avg_comments
-            }
+    try:
+        report = await reports.latest("analyze_audience", fresh=fresh)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error analyzing audience: {str(e)}")
     
-    audience_prompt = f"""
+    return {**report.result, "computed_at": report.computed_at}
+
+async def audience_inputs():
+    # Calculate engagement metrics for analysis
+    return audience_engagement_data(
+        {post_type: type_averages(post_type) for post_type in POST_TYPES}
+    )
+
+async def compute_audience_analysis(engagement_data):
+    return {
+        "engagement_data": engagement_data,
+        "audience_insights": await generate_text(audience_prompt(engagement_data))
+    }
+
+@app.get("/analyze-audience/stream")
+async def stream_analyze_audience():
+    """
+    Streaming /analyze-audience: the engagement data first, then the AI
+    audience insights as they are generated (see stream_ai_text).
+    """
+    engagement_data = audience_engagement_data(
+        {post_type: type_averages(post_type) for post_type in POST_TYPES}
+    )
+    return stream_ai_text({"engagement_data": engagement_data}, audience_prompt(engagement_data))
+
+def audience_engagement_data(averages):
+    """Per-type averages in the /analyze-audience shape, skipping types without posts"""
+    return {
+        post_type: {
+            "avg_likes": type_average["likes"],
+            "avg_shares": type_average["shares"],
+            "avg_comments": type_average["comments"]
+        }
+        for post_type, type_average in averages.items() if type_average
+    }
+
+def audience_prompt(engagement_data):
+    return f"""
     Analyze this audience engagement data and provide insights:
 
     Engagement Metrics by Post Type:
@@ -526,41 +1145,50 @@ async def analyze_audience():
     4. Engagement Strategy: How to improve audience interaction
     5. Growth Opportunities: Areas for audience expansion
     """
-    
-    try:
-        response = model.generate_content(audience_prompt)
-        audience_analysis = response.text
-        
-        return {
-            "engagement_data": engagement_data,
-            "audience_insights": audience_analysis
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error analyzing audience: {str(e)}")
 
 @app.post("/predict-performance")
 async def predict_performance(
     post_type: str,
     content: str,
     time_of_day: str,
-    target_audience: str = "general"
+    target_audience: str = "general",
+    confidence: float = 0.95,
+    include_analysis: bool = False
 ):
     """
-    Predict potential performance of a post before publishing using Gemini AI.
+    Predict potential performance of a post before publishing.
+    Numbers come from the local regression model; Gemini is only called
+    when include_analysis is set.
     """
-    # Get historical performance data for this post type
-    similar_posts = db.get_posts_by_type(post_type)
-    if not similar_posts:
+    if predictor.type_count(post_type) == 0:
         raise HTTPException(status_code=400, detail="No historical data for this post type")
+    if not 0 < confidence < 1:
+        raise HTTPException(status_code=400, detail="confidence must be between 0 and 1")
+    
+    try:
+        hour, weekday = parse_time_of_day(time_of_day)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    avg_performance = {
-        "likes": sum(post["likes"] for post in similar_posts) / len(similar_posts),
-        "shares": sum(post["shares"] for post in similar_posts) / len(similar_posts),
-        "comments": sum(post["comments"] for post in similar_posts) / len(similar_posts)
+    prediction = predictor.predict(post_type, content, hour, weekday, confidence)
+    avg_performance = predictor.type_averages(post_type)
+    
+    result = {
+        "post_type": post_type,
+        "content": content,
+        "confidence": confidence,
+        "prediction": prediction,
+        "historical_performance": avg_performance
     }
     
+    if not include_analysis:
+        return result
+    
+    similar = await run_in_threadpool(similar_posts, content, 5, post_type)
+    result["similar_posts"] = similar
+    
     prediction_prompt = f"""
-    Predict the performance of this social media post:
+    Explain the predicted performance of this social media post:
 
     Post Details:
     - Type: {post_type}
@@ -568,123 +1196,130 @@ async def predict_performance(
     - Time of Day: {time_of_day}
     - Target Audience: {target_audience}
 
+    Model Prediction ({confidence:.0%} interval):
+    - Likes: {prediction['likes']['predicted']:.1f} ({prediction['likes']['lower']:.1f} - {prediction['likes']['upper']:.1f})
+    - Shares: {prediction['shares']['predicted']:.1f} ({prediction['shares']['lower']:.1f} - {prediction['shares']['upper']:.1f})
+    - Comments: {prediction['comments']['predicted']:.1f} ({prediction['comments']['lower']:.1f} - {prediction['comments']['upper']:.1f})
+
     Historical Average Performance for {post_type}:
     - Likes: {avg_performance['likes']:.1f}
     - Shares: {avg_performance['shares']:.1f}
     - Comments: {avg_performance['comments']:.1f}
-
+    {similar_posts_prompt(similar)}
     Please provide:
-    1. Performance Prediction: Expected engagement levels
-    2. Success Factors: What might drive engagement
-    3. Potential Challenges: What might limit performance
-    4. Optimization Tips: How to improve potential performance
-    5. Best Posting Strategy: Recommendations for maximum impact
+    1. Success Factors: What might drive engagement
+    2. Potential Challenges: What might limit performance
+    3. Optimization Tips: How to improve potential performance
+    4. Best Posting Strategy: Recommendations for maximum impact
     """
     
     try:
         response = model.generate_content(prediction_prompt)
-        performance_prediction = response.text
-        
-        return {
-            "post_type": post_type,
-            "content": content,
-            "historical_performance": avg_performance,
-            "prediction_analysis": performance_prediction
-        }
+        result["prediction_analysis"] = response.text
+        return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error predicting performance: {str(e)}")
 
+@app.post("/predict-performance/batch")
+async def predict_performance_batch(batch: BatchPredictionInput):
+    """
+    Score many candidate posts in one call with the local regression model.
+    Example:
+    {
+        "candidates": [
+            {"type": "reel", "time_of_day": "evening", "content": "New feature demo"},
+            {"type": "carousel", "time_of_day": "2024-12-31T09:00:00", "content": "Product updates"}
+        ],
+        "confidence": 0.9
+    }
+    """
+    if not predictor.is_trained:
+        raise HTTPException(status_code=400, detail="No historical data to predict from")
+    if not 0 < batch.confidence < 1:
+        raise HTTPException(status_code=400, detail="confidence must be between 0 and 1")
+    
+    rows = []
+    for candidate in batch.candidates:
+        try:
+            hour, weekday = parse_time_of_day(candidate.time_of_day)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        rows.append({
+            "type": candidate.type,
+            "content": candidate.content,
+            "hour": hour,
+            "weekday": weekday
+        })
+    
+    X = predictor.featurize_batch(rows)
+    predictions = predictor.to_response(*predictor.predict_batch(X, batch.confidence))
+    
+    return {
+        "confidence": batch.confidence,
+        "predictions": predictions
+    }
+
 @app.get("/visualize/engagement-trends")
 async def visualize_engagement_trends():
     """
     Generate interactive visualizations for engagement trends across different post types.
     """
+    return await engagement_trends_figure(
+        {post_type: type_averages(post_type) for post_type in POST_TYPES}
+    )
+
+async def engagement_trends_figure(averages):
+    """Build the engagement trends figure from per-type averages in the process pool"""
     # Prepare data for visualization
-    post_types = ["carousel", "reel", "static"]
     metrics = {
         "likes": [],
         "shares": [],
         "comments": []
     }
     
-    for post_type in post_types:
-        filtered_posts = db.get_posts_by_type(post_type)
-        if filtered_posts:
-            metrics["likes"].append(sum(post["likes"] for post in filtered_posts) / len(filtered_posts))
-            metrics["shares"].append(sum(post["shares"] for post in filtered_posts) / len(filtered_posts))
-            metrics["comments"].append(sum(post["comments"] for post in filtered_posts) / len(filtered_posts))
-    
-    # Create subplot with 3 metrics
-    fig = make_subplots(
-        rows=3, cols=1,
-        subplot_titles=("Average Likes", "Average Shares", "Average Comments"),
-        vertical_spacing=0.1
-    )
-    
-    # Add bar traces for each metric
-    fig.add_trace(go.Bar(x=post_types, y=metrics["likes"], name="Likes"), row=1, col=1)
-    fig.add_trace(go.Bar(x=post_types, y=metrics["shares"], name="Shares"), row=2, col=1)
-    fig.add_trace(go.Bar(x=post_types, y=metrics["comments"], name="Comments"), row=3, col=1)
-    
-    # Update layout
-    fig.update_layout(
-        height=800,
-        showlegend=False,
-        title_text="Engagement Metrics by Post Type",
-        template="plotly_dark"
-    )
+    for type_average in averages.values():
+        if type_average:
+            metrics["likes"].append(type_average["likes"])
+            metrics["shares"].append(type_average["shares"])
+            metrics["comments"].append(type_average["comments"])
     
-    return fig.to_json()
+    return await run_cpu(figures.engagement_trends_figure, list(averages), metrics)
 
 @app.get("/visualize/performance-heatmap")
 async def visualize_performance_heatmap():
     """
     Generate a heatmap showing performance patterns across different dimensions.
     """
-    # Extract hour from timestamp and categorize performance
-    performance_data = []
-    for post in db.get_all_posts():
-        timestamp = datetime.fromisoformat(post["timestamp"])
-        hour = timestamp.hour
-        total_engagement = post["likes"] + post["shares"] + post["comments"]
-        performance_data.append({
-            "hour": hour,
-            "type": post["type"],
-            "engagement": total_engagement
-        })
-    
-    # Create pivot table for heatmap
-    df = pd.DataFrame(performance_data)
-    pivot_table = df.pivot_table(
-        values="engagement",
-        index="type",
-        columns="hour",
-        aggfunc="mean",
-        fill_value=0
-    )
-    
-    # Create heatmap
-    fig = go.Figure(data=go.Heatmap(
-        z=pivot_table.values,
-        x=pivot_table.columns,
-        y=pivot_table.index,
-        colorscale="Viridis"
-    ))
-    
-    fig.update_layout(
-        title="Engagement Heatmap: Post Type vs. Hour of Day",
-        xaxis_title="Hour of Day",
-        yaxis_title="Post Type",
-        template="plotly_dark"
-    )
+    return await performance_heatmap_figure()
+
+async def performance_heatmap_figure():
+    """Build the engagement heatmap from the shared aggregates in the process pool"""
+    hourly_engagement = aggregates.hourly_engagement()
+    if hourly_engagement is None:
+        # Shared aggregates not built yet: sum the posts here
+        posts = await run_in_threadpool(db.get_all_posts)
+        hourly_engagement = hourly_means(compute_cells(posts))
     
-    return fig.to_json()
+    return await run_cpu(figures.performance_heatmap_figure, hourly_engagement)
 
 @app.get("/visualize/content-impact")
 async def visualize_content_impact():
     """
     Generate a bubble chart showing the impact of different content types.
     """
+    if snapshot is not None:
+        # Post columns from the shared snapshot, with changes since it was taken
+        await run_in_threadpool(snapshot.catch_up, db)
+        columns = snapshot.current_columns()
+        likes, shares, comments = columns["likes"], columns["shares"], columns["comments"]
+        content_data = {
+            "type": np.array(POST_TYPES + ["other"])[columns["type"]],
+            "engagement": likes + shares + comments,
+            "virality": shares / (likes + 1),  # Adding 1 to avoid division by zero
+            "comments": comments
+        }
+        return await run_cpu(figures.content_impact_figure, content_data)
+    
     # Prepare data for visualization
     content_data = []
     for post in db.get_all_posts():
@@ -697,27 +1332,7 @@ async def visualize_content_impact():
             "comments": post["comments"]
         })
     
-    df = pd.DataFrame(content_data)
-    
-    # Create bubble chart
-    fig = px.scatter(
-        df,
-        x="engagement",
-        y="virality",
-        size="comments",
-        color="type",
-        hover_name="type",
-        title="Content Impact Analysis",
-        labels={
-            "engagement": "Total Engagement",
-            "virality": "Virality Score",
-            "comments": "Number of Comments"
-        }
-    )
-    
-    fig.update_layout(template="plotly_dark")
-    
-    return fig.to_json()
+    return await run_cpu(figures.content_impact_figure, content_data)
 
 @app.get("/visualize/sentiment-distribution/{post_id}")
 async def visualize_sentiment_distribution(post_id: str):
@@ -742,22 +1357,142 @@ async def visualize_sentiment_distribution(post_id: str):
         sentiments = response.text.strip().split(',')
         positive, negative, neutral = map(int, sentiments)
         
-        # Create pie chart
-        fig = go.Figure(data=[go.Pie(
-            labels=['Positive', 'Negative', 'Neutral'],
-            values=[positive, negative, neutral],
-            hole=.3
-        )])
-        
-        fig.update_layout(
-            title=f"Sentiment Distribution for Post {post_id}",
-            template="plotly_dark"
-        )
-        
-        return fig.to_json()
+        return await run_cpu(figures.sentiment_distribution_figure, post_id, positive, negative, neutral)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error analyzing sentiments: {str(e)}")
 
+# Columns the dashboard's post list shows
+DASHBOARD_POST_FIELDS = ("id", "type", "likes", "shares", "comments", "timestamp")
+
+@app.get("/dashboard")
+async def get_dashboard(post_type: str = "carousel", posts_limit: int = 12, include_figures: bool = True):
+    """
+    Everything the dashboard renders in one call: per-type analytics and
+    engagement rates, insights for post_type, time analytics, trending
+    hashtags, the first page of post_type posts and (optionally) the trend
+    and heatmap figures. The per-type aggregates are read once and shared
+    by every part; the posts page and figures are built concurrently.
+    AI narratives are left out so the numbers return immediately; stream
+    them from /dashboard/narratives.
+    """
+    if not 1 <= posts_limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"posts_limit must be between 1 and {MAX_PAGE_SIZE}")
+    
+    averages = {t: type_averages(t) for t in POST_TYPES}
+    if post_type not in averages:
+        averages[post_type] = type_averages(post_type)
+    analytics = {t: analytics_summary(type_average) for t, type_average in averages.items()}
+    
+    parts = [run_in_threadpool(
+        db.get_posts_page, posts_limit, None, post_type, None, None, None, DASHBOARD_POST_FIELDS
+    )]
+    if include_figures:
+        parts.append(engagement_trends_figure({t: averages[t] for t in POST_TYPES}))
+        parts.append(performance_heatmap_figure())
+    (posts, next_state), *figure_json = await asyncio.gather(*parts)
+    
+    return ORJSONResponse({
+        "post_type": post_type,
+        "analytics": analytics,
+        "engagement_rates": compute_engagement_rates(analytics),
+        "insights": generate_insights(post_type, analytics[post_type]),
+        "time_analytics": time_analytics(),
+        "trending_hashtags": trending_hashtags(),
+        "posts": posts,
+        "posts_next": encode_cursor(next_state),
+        "figures": dict(zip(("engagement_trends", "performance_heatmap"), figure_json)),
+        "narratives": "/dashboard/narratives"
+    })
+
+# Dashboard narrative -> (report job, field of its result)
+NARRATIVES = {
+    "performance_analysis": ("performance_analysis", "ai_analysis"),
+    "content_calendar": ("content_calendar", "calendar_recommendations"),
+    "audience_insights": ("analyze_audience", "audience_insights")
+}
+
+@app.get("/dashboard/narratives")
+async def stream_dashboard_narratives(names: Optional[str] = None):
+    """
+    Server-sent events carrying the dashboard's AI narratives
+    (performance_analysis, content_calendar, audience_insights), each sent
+    as soon as it is available, followed by a final "done" event. Narratives
+    come from the precomputed reports, so usually all arrive at once.
+    names is a comma-separated subset to stream (default: all), so a page
+    only waits on, and may trigger Gemini for, the narratives it shows.
+    """
+    selected = [name.strip() for name in names.split(",") if name.strip()] if names else list(NARRATIVES)
+    unknown = [name for name in selected if name not in NARRATIVES]
+    if unknown or not selected:
+        raise HTTPException(
+            status_code=400,
+            detail=f"names must be a comma-separated subset of {', '.join(NARRATIVES)}"
+        )
+    
+    async def events():
+        pending = {
+            asyncio.ensure_future(reports.latest(job)): (name, field)
+            for name, (job, field) in ((name, NARRATIVES[name]) for name in selected)
+        }
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name, field = pending.pop(task)
+                    try:
+                        yield sse_event(name, {"text": task.result().result[field]})
+                    except Exception as e:
+                        yield sse_event(name, {"error": f"Error generating {name}: {str(e)}"})
+            yield sse_event("done", {})
+        finally:
+            # Client went away: stop waiting (the job runs themselves carry on and are saved)
+            for task in pending:
+                task.cancel()
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+def stream_ai_text(data, prompt):
+    """
+    Server-sent events for the /stream variants of the AI endpoints: a "data"
+    event with the numeric results right away, then the Gemini text as
+    "chunk" events while it is generated, and a final "done" event (or an
+    "error" event if generation fails part way).
+    """
+    async def events():
+        yield sse_event("data", data)
+        try:
+            response = await run_in_threadpool(model.generate_content, prompt, stream=True)
+            # Each next() blocks on the network, so pull the chunks from the threadpool
+            async for chunk in iterate_in_threadpool(iter(response)):
+                yield sse_event("chunk", {"text": chunk.text})
+        except Exception as e:
+            yield sse_event("error", {"error": f"Error generating AI text: {str(e)}"})
+            return
+        yield sse_event("done", {})
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+# Keep proxies from buffering the event stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def sse_event(event, data):
+    """Format one server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def parse_date_range(start_date, end_date, default_days=7):
+    """Parse optional YYYY-MM-DD bounds, defaulting to the last default_days days"""
+    try:
+        end = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else datetime.now().date()
+        start = (
+            datetime.strptime(start_date, "%Y-%m-%d").date() if start_date
+            else end - timedelta(days=default_days - 1)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {str(e)}")
+    if start > end:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+    return start, end
+
 def generate_insights(post_type, analytics_data):
     insights = []
     avg_likes = analytics_data['average_likes']
@@ -779,6 +1514,8 @@ def generate_insights(post_type, analytics_data):
     
     return insights
 
+IMPORT_DURATION.set(time.perf_counter() - _import_started)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
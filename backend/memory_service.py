@@ -0,0 +1,352 @@
+import threading
+import time
+from datetime import datetime, date, timezone
+
+from db_config import CHANGE_LOG_TTL_SECONDS
+from hyperloglog import EngagementReach, event_day
+from posts import PostRecord
+from storage import StorageBackend
+
+
+def _to_datetime(value):
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value))
+    if value.tzinfo is not None:
+        # The driver stores aware datetimes as UTC and reads them back naive
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class InMemoryService(StorageBackend):
+    """Dict-backed stand-in for DataStaxService, for benchmarks and local runs.
+
+    Each table is a dict keyed by its CQL primary key, so writes are upserts
+    and range reads come back in clustering order, as they would from Cassandra.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.posts = {}
+        self.analytics = {}
+        self.user_engagement = {}
+        self.user_engagement_by_user = {}
+        self.content_performance = {}
+        self.engagement_sketches = {}
+        self.reach_sketches = {}
+        # name -> (owner, expires_at epoch seconds), like the TTL'd job_leases rows
+        self.job_leases = {}
+        self.reports = {}
+        # (changed_at epoch ms, post_id), like the post_changes table
+        self.post_changes = []
+        self.reach = EngagementReach(self)
+
+    def save_post(self, post_data):
+        """Save a post"""
+        row = PostRecord(
+            post_data["id"],
+            post_data["type"],
+            post_data["content"],
+            post_data["likes"],
+            post_data["shares"],
+            post_data["comments"],
+            _to_datetime(post_data["timestamp"]),
+            # Cassandra stores an empty list as null
+            list(post_data.get("comment_list") or []) or None
+        )
+        with self._lock:
+            self.posts[row.id] = row
+            self._log_changes([row.id])
+
+    def _log_changes(self, post_ids):
+        # Entries expire like the TTL'd post_changes rows; they are appended in time order
+        now_ms = int(time.time() * 1000)
+        self.post_changes.extend((now_ms, post_id) for post_id in post_ids)
+        expired_before = now_ms - CHANGE_LOG_TTL_SECONDS * 1000
+        if self.post_changes and self.post_changes[0][0] < expired_before:
+            self.post_changes = [change for change in self.post_changes if change[0] >= expired_before]
+
+    def get_post(self, post_id):
+        """Retrieve a post by ID"""
+        row = self.posts.get(post_id)
+        return row.copy() if row else None
+
+    def get_all_posts(self):
+        """Retrieve all posts"""
+        with self._lock:
+            return [row.copy() for row in self.posts.values()]
+
+    def scan_posts(self, page_size=5000):
+        """Yield every post a page at a time"""
+        with self._lock:
+            post_ids = list(self.posts)
+        for start in range(0, len(post_ids), page_size):
+            with self._lock:
+                page = [self.posts[post_id].copy() for post_id in post_ids[start:start + page_size]
+                        if post_id in self.posts]
+            if page:
+                yield page
+
+    def get_posts_by_type(self, post_type):
+        """Retrieve all posts of a given type"""
+        with self._lock:
+            return [row.copy() for row in self.posts.values() if row.type == post_type]
+
+    def get_posts_page(self, limit, cursor=None, post_type=None, start=None, end=None,
+                       min_engagement=None, fields=None):
+        """One page of posts in id order and the cursor for the next one (None when done)"""
+        after = cursor.decode() if cursor else None
+        rows = []
+        with self._lock:
+            for post_id in sorted(self.posts):
+                if after is not None and post_id <= after:
+                    continue
+                row = self.posts[post_id]
+                if post_type is not None and row.type != post_type:
+                    continue
+                if start is not None and row.timestamp < start:
+                    continue
+                if end is not None and row.timestamp > end:
+                    continue
+                if (
+                    min_engagement is not None
+                    and (row.likes or 0) + (row.shares or 0) + (row.comments or 0) < min_engagement
+                ):
+                    continue
+                if len(rows) == limit:
+                    return rows, rows[-1]["id"].encode()
+                rows.append({field: row[field] for field in fields} if fields else row.copy())
+        return rows, None
+
+    def get_post_type(self, post_id):
+        """Look up a post's type"""
+        row = self.posts.get(post_id)
+        return row.type if row else None
+
+    def get_post_types(self, post_ids, concurrency=100):
+        """{post_id: type} for the posts that exist"""
+        with self._lock:
+            return {post_id: self.posts[post_id].type for post_id in post_ids if post_id in self.posts}
+
+    def get_posts(self, post_ids, concurrency=100):
+        """Retrieve many posts by ID, skipping missing ones"""
+        with self._lock:
+            return [self.posts[post_id].copy() for post_id in post_ids if post_id in self.posts]
+
+    def get_changed_post_ids(self, since, concurrency=100):
+        """IDs of posts changed at or after since (epoch milliseconds)"""
+        with self._lock:
+            return {post_id for changed_at, post_id in self.post_changes if changed_at >= since}
+
+    def save_analytics(self, post_id, engagement_count, sentiment_score):
+        """Save analytics data"""
+        now = datetime.now()
+        today = date(now.year, now.month, now.day)
+        with self._lock:
+            self.analytics[(post_id, today, now.hour)] = {
+                "post_id": post_id,
+                "date": today,
+                "hour": now.hour,
+                "engagement_count": engagement_count,
+                "sentiment_score": sentiment_score
+            }
+
+    def get_performance_by_type(self, post_type, start_date, end_date):
+        """Get performance metrics for a post type within a date range"""
+        with self._lock:
+            rows = [
+                row for key, row in self.content_performance.items()
+                if key[0] == post_type and start_date <= key[1] <= end_date
+            ]
+        rows.sort(key=lambda row: (row["date"], row["hour"]))
+        return [
+            {key: row[key] for key in ("date", "hour", "total_engagement", "avg_sentiment")}
+            for row in rows
+        ]
+
+    def get_engagement_trends(self):
+        """Get engagement trends across all post types"""
+        totals = {}
+        with self._lock:
+            for (post_type, day, _), row in self.content_performance.items():
+                key = (post_type, day)
+                totals[key] = totals.get(key, 0) + (row["total_engagement"] or 0)
+        return [
+            {"post_type": post_type, "date": day, "total_engagement": total}
+            for (post_type, day), total in sorted(totals.items())
+        ]
+
+    def update_content_performance(self, post_type, engagement_delta, sentiment_score):
+        """Update content performance metrics"""
+        now = datetime.now()
+        key = (post_type, date(now.year, now.month, now.day), now.hour)
+        with self._lock:
+            row = self.content_performance.get(key)
+            total = (row["total_engagement"] or 0) if row else 0
+            self.content_performance[key] = {
+                "post_type": post_type,
+                "date": key[1],
+                "hour": key[2],
+                "total_engagement": total + engagement_delta,
+                "avg_sentiment": sentiment_score
+            }
+
+    def get_analytics_dataframe(self, start_date, end_date):
+        """Get analytics data as a pandas DataFrame"""
+        import pandas as pd
+        with self._lock:
+            rows = [row for key, row in self.analytics.items() if start_date <= key[1] <= end_date]
+        return pd.DataFrame(rows)
+
+    def _insert_engagement(self, user_id, post_id, engagement_type, timestamp):
+        timestamp = _to_datetime(timestamp)
+        self.user_engagement[(user_id, post_id)] = {
+            "user_id": user_id,
+            "post_id": post_id,
+            "engagement_type": engagement_type,
+            "timestamp": timestamp
+        }
+        self.user_engagement_by_user.setdefault(user_id, {})[(timestamp, post_id)] = {
+            "post_id": post_id,
+            "engagement_type": engagement_type,
+            "timestamp": timestamp
+        }
+
+    def save_user_engagement(self, user_id, post_id, engagement_type, timestamp=None):
+        """Save user engagement data (timestamp defaults to now, as naive UTC like every stored timestamp)"""
+        now = timestamp or datetime.now(timezone.utc).replace(tzinfo=None)
+        with self._lock:
+            self._insert_engagement(user_id, post_id, engagement_type, now)
+        self.reach.record([user_id], post_id, self.get_post_type(post_id), event_day(now))
+
+    def save_user_engagements(self, events, concurrency=100):
+        """Save many (user_id, post_id, engagement_type, timestamp) events; returns the failed indices (none)"""
+        with self._lock:
+            for user_id, post_id, engagement_type, timestamp in events:
+                self._insert_engagement(user_id, post_id, engagement_type, timestamp)
+        return set()
+
+    def add_post_engagement(self, deltas, concurrency=100):
+        """Apply {post_id: (likes, shares, comments)} deltas to posts; returns (post types, failed ids)"""
+        post_types = {}
+        with self._lock:
+            for post_id, (likes, shares, comments) in deltas.items():
+                row = self.posts.get(post_id)
+                if row is None:
+                    continue
+                row.likes = (row.likes or 0) + likes
+                row.shares = (row.shares or 0) + shares
+                row.comments = (row.comments or 0) + comments
+                post_types[post_id] = row.type
+            self._log_changes(post_types)
+        # Applied under the lock, so nothing can fail part way
+        return post_types, set()
+
+    def add_content_performance(self, deltas, concurrency=100):
+        """Apply {(post_type, date, hour): engagement} deltas; returns the keys that failed (none)"""
+        with self._lock:
+            for key, delta in deltas.items():
+                row = self.content_performance.get(key)
+                if row is None:
+                    row = self.content_performance[key] = {
+                        "post_type": key[0],
+                        "date": key[1],
+                        "hour": key[2],
+                        "total_engagement": 0,
+                        "avg_sentiment": None
+                    }
+                row["total_engagement"] = (row["total_engagement"] or 0) + delta
+        return set()
+
+    def get_user_engagement_history(self, user_id, limit=100):
+        """Get engagement history for a user, newest first"""
+        with self._lock:
+            rows = self.user_engagement_by_user.get(user_id, {})
+            # Clustering order: timestamp DESC, post_id ASC
+            keys = sorted(rows, key=lambda key: key[1])
+            keys.sort(key=lambda key: key[0], reverse=True)
+            return [dict(rows[key]) for key in keys[:limit]]
+
+    def save_engagement_sketches(self, rows, concurrency=100):
+        """Save many (post_type, day, metric, writer_id, sketch) rows; returns the keys that failed (none)"""
+        with self._lock:
+            for post_type, day, metric, writer_id, sketch in rows:
+                self.engagement_sketches[(post_type, day, metric, writer_id)] = bytes(sketch)
+        return set()
+
+    def get_writer_engagement_sketches(self, keys, writer_id, concurrency=100):
+        """Get one writer's sketches for many (post_type, day, metric) keys; returns {key: sketch}"""
+        with self._lock:
+            return {
+                key: self.engagement_sketches[(*key, writer_id)]
+                for key in keys if (*key, writer_id) in self.engagement_sketches
+            }
+
+    def get_engagement_sketches(self, post_type, start_date=None, end_date=None):
+        """Get the serialized quantile sketches for a post type within a date range"""
+        with self._lock:
+            return [
+                {"date": day, "metric": metric, "writer_id": writer_id, "sketch": sketch}
+                for (row_type, day, metric, writer_id), sketch in sorted(self.engagement_sketches.items())
+                if row_type == post_type
+                and (start_date is None or day >= start_date)
+                and (end_date is None or day <= end_date)
+            ]
+
+    def has_engagement_sketches(self):
+        """Check whether any quantile sketches have been stored"""
+        return bool(self.engagement_sketches)
+
+    def save_reach_sketches(self, rows, concurrency=100):
+        """Save many (scope, key, day, writer_id, sketch) rows; returns the keys that failed (none)"""
+        with self._lock:
+            for scope, key, day, writer_id, sketch in rows:
+                self.reach_sketches[(scope, key, day, writer_id)] = bytes(sketch)
+        return set()
+
+    def get_writer_reach_sketches(self, keys, writer_id, concurrency=100):
+        """Get one writer's sketches for many (scope, key, day) keys; returns {key: sketch}"""
+        with self._lock:
+            return {
+                key: self.reach_sketches[(*key, writer_id)]
+                for key in keys if (*key, writer_id) in self.reach_sketches
+            }
+
+    def get_reach_sketches(self, scope, key, start_date=None, end_date=None):
+        """Get all writers' unique engager sketches for a date range"""
+        with self._lock:
+            return [
+                {"date": day, "writer_id": writer_id, "sketch": sketch}
+                for (row_scope, row_key, day, writer_id), sketch in sorted(self.reach_sketches.items())
+                if row_scope == scope and row_key == key
+                and (start_date is None or day >= start_date)
+                and (end_date is None or day <= end_date)
+            ]
+
+    def acquire_lease(self, name, owner, ttl_seconds):
+        """Take or renew the named lease for ttl_seconds unless another owner holds it"""
+        now = time.time()
+        with self._lock:
+            holder = self.job_leases.get(name)
+            if holder is not None and holder[1] > now and holder[0] != owner:
+                return False
+            self.job_leases[name] = (owner, now + ttl_seconds)
+            return True
+
+    def save_report(self, name, data_version, computed_at, payload):
+        """Save the latest result of a background job"""
+        with self._lock:
+            self.reports[name] = {
+                "name": name,
+                "data_version": data_version,
+                "computed_at": computed_at,
+                "payload": payload
+            }
+
+    def get_report(self, name):
+        """Get the latest result of a background job, or None"""
+        report = self.reports.get(name)
+        return dict(report) if report else None
+
+    def close(self):
+        """Flush pending sketches"""
+        self.reach.flush()
@@ -0,0 +1,424 @@
+import bisect
+import re
+import threading
+import time
+
+# Default latency buckets in seconds (1 ms .. 30 s)
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    # += is a read-modify-write across threads (and the threadpool), so each child has a lock
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "_lock", "_counts", "_sum")
+
+    def __init__(self, bounds):
+        self._bounds = bounds
+        self._lock = threading.Lock()
+        # One slot per bucket plus +Inf, allocated once up front
+        self._counts = [0] * (len(bounds) + 1)
+        self._sum = 0.0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    def snapshot(self):
+        """Bucket counts and sum, read together so the exposition is consistent"""
+        with self._lock:
+            return list(self._counts), self._sum
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._start)
+        return False
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Return the child metric for a set of label values"""
+        child = self._children.get(values)
+        if child is None:
+            # setdefault keeps this race-free without a lock
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}"
+        ]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default.set(value)
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class Histogram(_Metric):
+    """Distribution of observations in fixed, pre-allocated buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, values, ("le", _format_value(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    """Collection of metrics rendered together for /metrics"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self._metrics[metric.name] = metric
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format"""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+# HTTP
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ["method", "route", "status"]
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests currently being handled"
+)
+
+# DataStax
+CQL_DURATION = Histogram(
+    "cql_statement_duration_seconds", "CQL statement latency by statement", ["statement"]
+)
+CQL_ERRORS = Counter(
+    "cql_statement_errors_total", "CQL statement failures by statement", ["statement"]
+)
+
+# Gemini
+LLM_DURATION = Histogram(
+    "llm_request_duration_seconds", "Gemini call latency", ["operation"]
+)
+LLM_ERRORS = Counter(
+    "llm_request_errors_total", "Gemini call failures", ["operation"]
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total", "Gemini tokens used", ["kind"]
+)
+
+# Caches
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Cache lookups by cache and result (hit/miss)", ["cache", "result"]
+)
+
+# Ingest
+INGEST_QUEUE_DEPTH = Gauge(
+    "ingest_queue_depth", "Engagement events received but not yet written"
+)
+INGEST_EVENTS = Counter(
+    "ingest_events_total", "Engagement events processed by outcome", ["outcome"]
+)
+
+# Background jobs
+JOB_DURATION = Histogram(
+    "job_run_duration_seconds", "Background job run time", ["job"]
+)
+JOB_RUNS = Counter(
+    "job_runs_total", "Background job runs by outcome", ["job", "outcome"]
+)
+JOB_LAST_SUCCESS = Gauge(
+    "job_last_success_timestamp_seconds", "Unix time of the last successful job run", ["job"]
+)
+
+# Startup
+IMPORT_DURATION = Gauge(
+    "import_duration_seconds", "Time taken to import the application module"
+)
+STARTUP_DURATION = Gauge(
+    "startup_duration_seconds", "Time from the startup event until the service was ready"
+)
+
+
+_STATEMENT_RE = re.compile(
+    r"^\s*(SELECT\b.*?\bFROM|INSERT\s+INTO|UPDATE|DELETE\b.*?\bFROM|CREATE\s+\w+\s+IF\s+NOT\s+EXISTS)\s+(\w+)",
+    re.IGNORECASE | re.DOTALL
+)
+_statement_names = {}
+
+
+def statement_name(query):
+    """Short, low-cardinality label for a CQL query, e.g. 'SELECT posts'"""
+    # A BoundStatement only carries its text on the statement it was bound from
+    query = getattr(query, "prepared_statement", query)
+    query = getattr(query, "query_string", query)
+    if not isinstance(query, str):
+        return "other"
+    name = _statement_names.get(query)
+    if name is None:
+        match = _STATEMENT_RE.match(query)
+        if match:
+            name = f"{match.group(1).split()[0].upper()} {match.group(2)}"
+        else:
+            name = "other"
+        if len(_statement_names) < 1000:
+            _statement_names[query] = name
+    return name
+
+
+class InstrumentedSession:
+    """Wraps a driver session to time every synchronous execute() by statement"""
+
+    def __init__(self, session):
+        self._session = session
+
+    def execute(self, query, *args, **kwargs):
+        name = statement_name(query)
+        start = time.perf_counter()
+        try:
+            return self._session.execute(query, *args, **kwargs)
+        except Exception:
+            CQL_ERRORS.labels(name).inc()
+            raise
+        finally:
+            CQL_DURATION.labels(name).observe(time.perf_counter() - start)
+
+    def __getattr__(self, attr):
+        return getattr(self._session, attr)
+
+
+class InstrumentedModel:
+    """Wraps a Gemini model to record call latency, failures and token usage"""
+
+    def __init__(self, model):
+        self._model = model
+
+    def generate_content(self, *args, **kwargs):
+        operation = "stream" if kwargs.get("stream") else "generate"
+        start = time.perf_counter()
+        try:
+            response = self._model.generate_content(*args, **kwargs)
+        except Exception:
+            LLM_ERRORS.labels(operation).inc()
+            LLM_DURATION.labels(operation).observe(time.perf_counter() - start)
+            raise
+        if operation == "stream":
+            # Timing and token counts are only known once the stream is consumed
+            return InstrumentedStream(response, start)
+        LLM_DURATION.labels(operation).observe(time.perf_counter() - start)
+        record_token_usage(response)
+        return response
+
+    def __getattr__(self, attr):
+        return getattr(self._model, attr)
+
+
+class InstrumentedStream:
+    """Wraps a streamed Gemini response, recording the call once it is fully read"""
+
+    def __init__(self, response, start):
+        self._response = response
+        self._start = start
+
+    def __iter__(self):
+        try:
+            yield from self._response
+        except Exception:
+            LLM_ERRORS.labels("stream").inc()
+            raise
+        finally:
+            LLM_DURATION.labels("stream").observe(time.perf_counter() - self._start)
+        record_token_usage(self._response)
+
+    def __getattr__(self, attr):
+        return getattr(self._response, attr)
+
+
+def record_token_usage(response):
+    """Count prompt and output tokens if the response reports them"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    if prompt_tokens:
+        LLM_TOKENS.labels("prompt").inc(prompt_tokens)
+    if output_tokens:
+        LLM_TOKENS.labels("output").inc(output_tokens)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route request latency"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_PROGRESS.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_PROGRESS.dec()
+            # Label by route template, not raw path, to keep cardinality bounded
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            HTTP_REQUEST_DURATION.labels(scope["method"], route_path, str(status)).observe(
+                time.perf_counter() - start
+            )
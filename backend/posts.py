@@ -0,0 +1,163 @@
+import operator
+import re
+import zlib
+from datetime import timezone
+
+import orjson
+from fastapi.responses import Response
+
+POST_FIELDS = ("id", "type", "content", "likes", "shares", "comments", "timestamp", "comment_list")
+
+# Post types the rest of the API reports on; anything else falls into "other"
+POST_TYPES = ["carousel", "reel", "static"]
+
+TOKEN_RE = re.compile(r"#?\w+")
+
+
+def type_index(post_type):
+    """Position of a post type in POST_TYPES, or len(POST_TYPES) for any other type"""
+    try:
+        return POST_TYPES.index(post_type)
+    except ValueError:
+        return len(POST_TYPES)
+
+
+def tokenize(content):
+    """Lowercased words and #hashtags of a post's content"""
+    return TOKEN_RE.findall((content or "").lower())
+
+
+def signed_hash(token, buckets):
+    """(bucket, sign) of a token for feature hashing.
+
+    The sign comes from a bit the bucket doesn't use, so collisions cancel out
+    on average instead of biasing buckets upwards.
+    """
+    h = zlib.crc32(token.encode("utf-8"))
+    return h % buckets, 1.0 if h & 0x80000000 else -1.0
+
+
+class PostRecord:
+    """A post row with __slots__ instead of a per-instance dict.
+
+    Supports the read side of the mapping protocol (post["likes"], post.get(),
+    dict(post)), so code written against the driver's dict rows keeps working.
+    """
+
+    __slots__ = POST_FIELDS
+
+    def __init__(self, id, type, content=None, likes=0, shares=0, comments=0,
+                 timestamp=None, comment_list=None):
+        self.id = id
+        self.type = type
+        self.content = content
+        self.likes = likes
+        self.shares = shares
+        self.comments = comments
+        self.timestamp = timestamp
+        self.comment_list = comment_list
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(*(data.get(field) for field in POST_FIELDS))
+
+    @classmethod
+    def from_model(cls, post):
+        """Build a record straight from a pydantic Post, without post.dict()"""
+        timestamp = post.timestamp
+        if timestamp.tzinfo is not None:
+            # Stored rows are naive UTC; live updates must bin the post the same way rebuilds do
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        return cls(
+            post.id, post.type, post.content, post.likes, post.shares, post.comments,
+            timestamp, post.comment_list
+        )
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in POST_FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in POST_FIELDS
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in POST_FIELDS else default
+
+    def keys(self):
+        return POST_FIELDS
+
+    def copy(self):
+        return PostRecord(*(getattr(self, field) for field in POST_FIELDS))
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in POST_FIELDS}
+
+    def __eq__(self, other):
+        if not isinstance(other, PostRecord):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in POST_FIELDS)
+
+    def __repr__(self):
+        return f"PostRecord(id={self.id!r}, type={self.type!r})"
+
+
+def parse_fields(fields):
+    """Parse a comma-separated fields= projection; id is always included.
+
+    The result is in POST_FIELDS order whatever order the client used, so each
+    set of fields maps to a single prepared statement.
+    """
+    if not fields:
+        return None
+    selected = {"id"}
+    for field in fields.split(","):
+        field = field.strip()
+        if field not in POST_FIELDS:
+            raise ValueError(f"Unknown field: {field}")
+        selected.add(field)
+    return tuple(field for field in POST_FIELDS if field in selected)
+
+
+def post_row_factory(colnames, rows):
+    """Driver row factory building PostRecords directly from the row tuples"""
+    index = {name: i for i, name in enumerate(colnames)}
+    if all(field in index for field in POST_FIELDS):
+        getter = operator.itemgetter(*(index[field] for field in POST_FIELDS))
+        return [PostRecord(*getter(row)) for row in rows]
+    positions = [index.get(field) for field in POST_FIELDS]
+    return [
+        PostRecord(*(None if i is None else row[i] for i in positions))
+        for row in rows
+    ]
+
+
+def _default(value):
+    if isinstance(value, PostRecord):
+        return value.to_dict()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content):
+    """Serialize a response body with orjson, including PostRecords"""
+    return orjson.dumps(
+        content, default=_default,
+        option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    )
+
+
+class ORJSONResponse(Response):
+    """JSON response rendered with orjson, skipping FastAPI's jsonable_encoder"""
+
+    media_type = "application/json"
+
+    def render(self, content):
+        return dumps(content)
@@ -0,0 +1,341 @@
+import os
+import threading
+from datetime import datetime
+from statistics import NormalDist
+
+import numpy as np
+
+from posts import POST_TYPES, signed_hash, tokenize, type_index
+
+TARGETS = ["likes", "shares", "comments"]
+
+# Feature layout: bias | post type one-hot | hour of day | day of week | text stats | hashed tokens
+HASH_BUCKETS = 256
+_TYPE_OFFSET = 1
+_HOUR_OFFSET = _TYPE_OFFSET + len(POST_TYPES) + 1
+_DOW_OFFSET = _HOUR_OFFSET + 24
+_TEXT_OFFSET = _DOW_OFFSET + 7
+_HASH_OFFSET = _TEXT_OFFSET + 2
+N_FEATURES = _HASH_OFFSET + HASH_BUCKETS
+
+# Representative hours for the free-text time_of_day values the API accepts
+TIME_OF_DAY_HOURS = {
+    "morning": 9,
+    "afternoon": 14,
+    "evening": 19,
+    "night": 22,
+}
+
+MODEL_PATH = os.getenv("PREDICTION_MODEL_PATH", "prediction_model.npz")
+
+
+def parse_time_of_day(time_of_day):
+    """Resolve a time_of_day value to an (hour, weekday) pair; weekday may be None"""
+    if isinstance(time_of_day, datetime):
+        return time_of_day.hour, time_of_day.weekday()
+
+    value = str(time_of_day).strip().lower()
+    if value in TIME_OF_DAY_HOURS:
+        return TIME_OF_DAY_HOURS[value], None
+
+    try:
+        parsed = datetime.fromisoformat(value.upper())
+        return parsed.hour, parsed.weekday()
+    except ValueError:
+        pass
+
+    for fmt in ("%H:%M", "%H", "%I%p", "%I:%M%p", "%I %p"):
+        try:
+            return datetime.strptime(value.upper(), fmt).hour, None
+        except ValueError:
+            continue
+
+    raise ValueError(f"Unrecognised time_of_day: {time_of_day}")
+
+
+def _encode(row, post_type, hour, weekday, content):
+    """Write the feature vector of a single post into row (a zeroed array)"""
+    row[0] = 1.0
+    row[_TYPE_OFFSET + type_index(post_type)] = 1.0
+
+    row[_HOUR_OFFSET + hour] = 1.0
+    if weekday is None:
+        # Unknown day: spread the weight evenly so no single day is favoured
+        row[_DOW_OFFSET:_DOW_OFFSET + 7] = 1.0 / 7
+    else:
+        row[_DOW_OFFSET + weekday] = 1.0
+
+    tokens = tokenize(content)
+    row[_TEXT_OFFSET] = np.log1p(len(tokens))
+    row[_TEXT_OFFSET + 1] = sum(1 for token in tokens if token.startswith("#"))
+
+    if tokens:
+        weight = 1.0 / np.sqrt(len(tokens))
+        for token in tokens:
+            bucket, sign = signed_hash(token, HASH_BUCKETS)
+            row[_HASH_OFFSET + bucket] += sign * weight
+
+
+def _post_timestamp(value):
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+class PerformancePredictor:
+    """Ridge regression over log engagement, trained from stored posts.
+
+    The model keeps the sufficient statistics (X'X, X'y, y'y) so that new posts
+    can be folded in without revisiting old ones, and refits by solving a single
+    small linear system.
+
+    Across workers, the model file is owned by the worker that refreshes the
+    shared aggregates: it fits on the same scan as each snapshot (recording
+    the snapshot's high-water mark), folds in posts created since from the
+    change log, and saves. Other workers fold in their own posts for
+    immediate use and reload the file when it changes. Engagement updates to
+    posts that are already in the model are picked up by the next refit.
+    """
+
+    def __init__(self, alpha=1.0, path=MODEL_PATH):
+        self.alpha = alpha
+        self.path = path
+        self._lock = threading.Lock()
+        self._xtx = np.zeros((N_FEATURES, N_FEATURES))
+        self._xty = np.zeros((N_FEATURES, len(TARGETS)))
+        self._yty = np.zeros(len(TARGETS))
+        self._type_totals = np.zeros((len(POST_TYPES) + 1, len(TARGETS)))
+        self._type_counts = np.zeros(len(POST_TYPES) + 1)
+        self.n_samples = 0
+        self.coef = np.zeros((N_FEATURES, len(TARGETS)))
+        self._cov = np.eye(N_FEATURES) / alpha
+        self.residual_var = np.zeros(len(TARGETS))
+        self.trained_at = None
+        # High-water mark of the snapshot the model was fit on, and the posts folded in since
+        self.high_water_mark = None
+        self._folded = set()
+        self._loaded_mtime = None
+        # Whether the model has changed since it was last saved or loaded
+        self.unsaved = False
+
+    @property
+    def is_trained(self):
+        return self.n_samples > 0
+
+    def type_count(self, post_type):
+        """Number of training posts seen for a post type"""
+        return int(self._type_counts[type_index(post_type)])
+
+    def type_averages(self, post_type):
+        """Average likes, shares and comments seen for a post type"""
+        i = type_index(post_type)
+        count = max(self._type_counts[i], 1)
+        return {
+            target: float(self._type_totals[i, j] / count)
+            for j, target in enumerate(TARGETS)
+        }
+
+    def featurize(self, post_type, content, hour, weekday=None):
+        """Build the feature vector for a single candidate post"""
+        row = np.zeros(N_FEATURES)
+        _encode(row, post_type, hour, weekday, content)
+        return row
+
+    def featurize_batch(self, candidates):
+        """Build the feature matrix for a list of candidate dicts"""
+        X = np.zeros((len(candidates), N_FEATURES))
+        for i, candidate in enumerate(candidates):
+            hour, weekday = candidate["hour"], candidate.get("weekday")
+            _encode(X[i], candidate["type"], hour, weekday, candidate.get("content"))
+        return X
+
+    def _posts_to_arrays(self, posts):
+        candidates = []
+        targets = []
+        for post in posts:
+            ts = _post_timestamp(post["timestamp"])
+            candidates.append({
+                "type": post["type"],
+                "content": post.get("content"),
+                "hour": ts.hour,
+                "weekday": ts.weekday()
+            })
+            targets.append([post["likes"] or 0, post["shares"] or 0, post["comments"] or 0])
+        X = self.featurize_batch(candidates)
+        counts = np.maximum(np.asarray(targets, dtype=float), 0)
+        return X, counts
+
+    def partial_fit(self, posts):
+        """Fold new posts into the model and refit the coefficients"""
+        posts = list(posts)
+        self._accumulate(posts)
+        with self._lock:
+            self._folded.update(post["id"] for post in posts)
+
+    def _accumulate(self, posts, refit=True):
+        if not posts:
+            return
+        X, counts = self._posts_to_arrays(posts)
+        Y = np.log1p(counts)
+        type_idx = np.argmax(X[:, _TYPE_OFFSET:_HOUR_OFFSET], axis=1)
+        with self._lock:
+            np.add.at(self._type_totals, type_idx, counts)
+            np.add.at(self._type_counts, type_idx, 1)
+            self._xtx += X.T @ X
+            self._xty += X.T @ Y
+            self._yty += np.einsum("ij,ij->j", Y, Y)
+            self.n_samples += len(posts)
+            self.unsaved = True
+            if refit:
+                self._refit()
+
+    def fit(self, posts, high_water_mark=None):
+        """Train from scratch on the given posts (a scan taken at high_water_mark)"""
+        with self._lock:
+            self._xtx[:] = 0
+            self._xty[:] = 0
+            self._yty[:] = 0
+            self._type_totals[:] = 0
+            self._type_counts[:] = 0
+            self.n_samples = 0
+            self.high_water_mark = high_water_mark
+            self._folded = set()
+            self.unsaved = True
+        self._accumulate(list(posts))
+
+    def accumulate(self, posts):
+        """Add one page of a scan to a model being trained for adopt(), without refitting"""
+        self._accumulate(list(posts), refit=False)
+
+    def adopt(self, trained, high_water_mark):
+        """Replace this model with one trained page by page on a scan taken at high_water_mark.
+
+        Training into a separate model keeps this one serving until the scan finishes.
+        """
+        with trained._lock, self._lock:
+            self._xtx = trained._xtx.copy()
+            self._xty = trained._xty.copy()
+            self._yty = trained._yty.copy()
+            self._type_totals = trained._type_totals.copy()
+            self._type_counts = trained._type_counts.copy()
+            self.n_samples = trained.n_samples
+            self.high_water_mark = high_water_mark
+            self._folded = set()
+            self.unsaved = True
+            self._refit()
+
+    def catch_up(self, changed_posts, snapshot):
+        """Fold in changed posts that are in neither the snapshot the model was fit on nor the model"""
+        if not changed_posts:
+            return
+        rows = snapshot.lookup([post["id"] for post in changed_posts])
+        new_posts = [
+            post for post, row in zip(changed_posts, rows)
+            if row < 0 and post["id"] not in self._folded
+        ]
+        self.partial_fit(new_posts)
+
+    def _refit(self):
+        A = self._xtx + self.alpha * np.eye(N_FEATURES)
+        self._cov = np.linalg.inv(A)
+        self.coef = self._cov @ self._xty
+        # SSE per target from the sufficient statistics: y'y - 2w'X'y + w'X'Xw
+        sse = (
+            self._yty
+            - 2 * np.einsum("ij,ij->j", self.coef, self._xty)
+            + np.einsum("ij,ij->j", self.coef, self._xtx @ self.coef)
+        )
+        dof = max(self.n_samples - 1, 1)
+        self.residual_var = np.maximum(sse, 0) / dof
+        self.trained_at = datetime.now()
+
+    def predict_batch(self, X, confidence=0.95):
+        """Score a feature matrix, returning (mean, lower, upper) count arrays"""
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        coef, cov, residual_var = self.coef, self._cov, self.residual_var
+        log_mean = X @ coef
+        leverage = np.einsum("ij,ij->i", X @ cov, X)
+        log_std = np.sqrt(residual_var[None, :] * (1.0 + leverage[:, None]))
+        mean = np.expm1(log_mean)
+        lower = np.expm1(log_mean - z * log_std)
+        upper = np.expm1(log_mean + z * log_std)
+        return np.maximum(mean, 0), np.maximum(lower, 0), np.maximum(upper, 0)
+
+    def predict(self, post_type, content, hour, weekday=None, confidence=0.95):
+        """Predict likes, shares and comments for a single candidate post"""
+        X = self.featurize(post_type, content, hour, weekday)[None, :]
+        return self.to_response(*self.predict_batch(X, confidence))[0]
+
+    @staticmethod
+    def to_response(mean, lower, upper):
+        """Convert prediction arrays into a list of JSON-friendly dicts"""
+        results = []
+        for i in range(mean.shape[0]):
+            results.append({
+                target: {
+                    "predicted": round(float(mean[i, j]), 1),
+                    "lower": round(float(lower[i, j]), 1),
+                    "upper": round(float(upper[i, j]), 1)
+                }
+                for j, target in enumerate(TARGETS)
+            })
+        return results
+
+    def save(self, path=None):
+        """Persist the coefficients and sufficient statistics"""
+        path = path or self.path
+        with self._lock:
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    n_features=N_FEATURES,
+                    alpha=self.alpha,
+                    xtx=self._xtx,
+                    xty=self._xty,
+                    yty=self._yty,
+                    type_totals=self._type_totals,
+                    type_counts=self._type_counts,
+                    n_samples=self.n_samples,
+                    coef=self.coef,
+                    residual_var=self.residual_var,
+                    high_water_mark=-1 if self.high_water_mark is None else self.high_water_mark,
+                    folded=np.array(sorted(self._folded), dtype=str)
+                )
+            os.replace(tmp_path, path)
+            self.unsaved = False
+
+    def load(self, path=None):
+        """Load a persisted model; returns False if none is usable"""
+        path = path or self.path
+        if not os.path.exists(path):
+            return False
+        with np.load(path) as data:
+            if int(data["n_features"]) != N_FEATURES:
+                return False
+            with self._lock:
+                self._loaded_mtime = os.stat(path).st_mtime_ns
+                high_water_mark = int(data["high_water_mark"]) if "high_water_mark" in data else -1
+                self.high_water_mark = None if high_water_mark < 0 else high_water_mark
+                self._folded = set(data["folded"].tolist()) if "folded" in data else set()
+                self.alpha = float(data["alpha"])
+                self._xtx = data["xtx"].copy()
+                self._xty = data["xty"].copy()
+                self._yty = data["yty"].copy()
+                self._type_totals = data["type_totals"].copy()
+                self._type_counts = data["type_counts"].copy()
+                self.n_samples = int(data["n_samples"])
+                self._refit()
+                self.unsaved = False
+        return True
+
+    def reload(self, path=None):
+        """Load the model file if it was saved since this worker last read it"""
+        path = path or self.path
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self._loaded_mtime:
+            return False
+        return self.load(path)
@@ -0,0 +1,311 @@
+import math
+import struct
+import threading
+from datetime import datetime, date
+
+import numpy as np
+
+from db_config import get_writer_id
+
+# Metrics tracked per post type and day
+METRICS = ["likes", "shares", "comments", "engagement"]
+
+# Relative accuracy of reported quantiles (1%)
+RELATIVE_ACCURACY = 0.01
+# Dense bucket count; with 1% accuracy this covers values up to ~1e17
+N_BUCKETS = 2048
+
+_HEADER = struct.Struct("<BdQQddd")
+_FORMAT_VERSION = 1
+
+
+class DDSketch:
+    """Mergeable quantile sketch for non-negative counts.
+
+    Values are placed in logarithmically sized buckets so every reported
+    quantile is within RELATIVE_ACCURACY of the true value. Two sketches with
+    the same accuracy merge by adding their bucket arrays, which makes them
+    cheap to combine across days and across writers.
+    """
+
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = np.zeros(N_BUCKETS, dtype=np.uint64)
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _index(self, values):
+        keys = np.ceil(np.log(values) / self._log_gamma).astype(np.int64)
+        return np.clip(keys, 0, N_BUCKETS - 1)
+
+    def add(self, value):
+        """Add a single value"""
+        self.add_many([value])
+
+    def add_many(self, values):
+        """Add an array of values"""
+        values = np.maximum(np.asarray(values, dtype=float), 0)
+        if values.size == 0:
+            return
+        positive = values[values >= 1]
+        self.zero_count += int(values.size - positive.size)
+        if positive.size:
+            np.add.at(self.buckets, self._index(positive), 1)
+        self.count += int(values.size)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def merge(self, other):
+        """Merge another sketch into this one"""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different accuracy")
+        self.buckets += other.buckets
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantiles(self, qs):
+        """Return the estimated value at each quantile in qs"""
+        if self.count == 0:
+            return [None for _ in qs]
+        cumulative = np.cumsum(self.buckets)
+        results = []
+        for q in qs:
+            rank = q * (self.count - 1)
+            if q <= 0:
+                value = self.min
+            elif q >= 1:
+                value = self.max
+            elif rank < self.zero_count:
+                value = 0.0
+            else:
+                key = int(np.searchsorted(cumulative, rank - self.zero_count, side="right"))
+                value = 2 * self.gamma ** key / (self.gamma + 1)
+            results.append(min(max(value, self.min), self.max))
+        return results
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def to_bytes(self):
+        """Serialize to a compact blob (only non-empty buckets are stored)"""
+        nonzero = np.flatnonzero(self.buckets).astype(np.uint16)
+        header = _HEADER.pack(
+            _FORMAT_VERSION,
+            self.relative_accuracy,
+            self.count,
+            self.zero_count,
+            self.sum,
+            self.min if self.count else 0.0,
+            self.max if self.count else 0.0
+        )
+        return (
+            header
+            + struct.pack("<I", nonzero.size)
+            + nonzero.tobytes()
+            + self.buckets[nonzero].tobytes()
+        )
+
+    @classmethod
+    def from_bytes(cls, blob):
+        """Deserialize a blob produced by to_bytes"""
+        blob = bytes(blob)
+        version, accuracy, count, zero_count, total, vmin, vmax = _HEADER.unpack_from(blob)
+        if version != _FORMAT_VERSION:
+            raise ValueError(f"Unsupported sketch format version: {version}")
+        offset = _HEADER.size
+        (n,) = struct.unpack_from("<I", blob, offset)
+        offset += 4
+        keys = np.frombuffer(blob, dtype=np.uint16, count=n, offset=offset)
+        offset += 2 * n
+        counts = np.frombuffer(blob, dtype=np.uint64, count=n, offset=offset)
+
+        sketch = cls(accuracy)
+        sketch.buckets[keys] = counts
+        sketch.count = count
+        sketch.zero_count = zero_count
+        sketch.sum = total
+        if count:
+            sketch.min = vmin
+            sketch.max = vmax
+        return sketch
+
+
+def _post_date(post):
+    timestamp = post["timestamp"]
+    if not isinstance(timestamp, datetime):
+        timestamp = datetime.fromisoformat(str(timestamp))
+    return date(timestamp.year, timestamp.month, timestamp.day)
+
+
+def _post_metrics(post):
+    likes = post["likes"] or 0
+    shares = post["shares"] or 0
+    comments = post["comments"] or 0
+    return {
+        "likes": likes,
+        "shares": shares,
+        "comments": comments,
+        "engagement": likes + shares + comments
+    }
+
+
+class EngagementDistributions:
+    """Per post type, per day engagement sketches backed by DataStax.
+
+    Each process keeps the sketches for what it has ingested and overwrites its
+    own rows (keyed by its writer id), so concurrent workers never race on a
+    read-modify-write of the same blob. The writer id is stable across restarts,
+    so a sketch first touched by this process resumes from its stored row.
+    Queries merge every writer's rows for the requested date range, so their
+    cost depends on the number of days, not the number of posts. Only today's
+    sketches and ones with unsaved updates stay in memory.
+
+    This is the distribution of engagement at creation time: each post is
+    recorded once, when it is saved, under the day of its timestamp. A sketch
+    can't take a value back out, so the ingest deltas that later update a
+    post's counts are deliberately not fed in (adding them as new samples
+    would count the post twice).
+    """
+
+    def __init__(self, db, writer_id=None):
+        self.db = db
+        self.writer_id = writer_id or get_writer_id()
+        self._lock = threading.Lock()
+        # Serializes saves so an older snapshot of a row never overwrites a newer one
+        self._save_lock = threading.Lock()
+        self._sketches = {}
+        self._dirty = set()
+        # Bumped on every eviction, so a load that raced one is known to be stale
+        self._evictions = 0
+
+    def _build(self, posts):
+        sketches = {}
+        for post in posts:
+            key = (post["type"], _post_date(post))
+            if key not in sketches:
+                sketches[key] = {metric: [] for metric in METRICS}
+            for metric, value in _post_metrics(post).items():
+                sketches[key][metric].append(value)
+
+        built = {}
+        for key, values in sketches.items():
+            built[key] = {}
+            for metric in METRICS:
+                sketch = DDSketch()
+                sketch.add_many(values[metric])
+                built[key][metric] = sketch
+        return built
+
+    @staticmethod
+    def _rows(writer_id, sketches):
+        return [
+            (post_type, day, metric, writer_id, sketch.to_bytes())
+            for (post_type, day), by_metric in sketches.items()
+            for metric, sketch in by_metric.items()
+        ]
+
+    def _persist(self, rows, concurrency=100):
+        """Save sketch rows in one concurrent batch; returns the (post_type, day) keys that failed"""
+        failed = self.db.save_engagement_sketches(rows, concurrency)
+        return {(post_type, day) for post_type, day, _, _ in failed}
+
+    def record_posts(self, posts, concurrency=100):
+        """Fold newly ingested posts into this writer's sketches and persist them.
+
+        Rows that fail to save stay dirty and are retried by the next call.
+        Saved sketches of past days are dropped from memory and reloaded from
+        this writer's rows when they are next touched.
+        """
+        new = self._build(posts)
+        loaded = {}
+        while True:
+            with self._lock:
+                missing = [key for key in new if key not in self._sketches and key not in loaded]
+                evictions = self._evictions
+            # Load outside the lock so a slow read doesn't stall other recorders
+            if missing:
+                loaded.update(self._load_many(missing, concurrency))
+            with self._lock:
+                if self._evictions != evictions:
+                    # A sketch may have been saved and evicted since it was read: read again
+                    loaded = {}
+                    continue
+                for key, by_metric in new.items():
+                    current = self._sketches.get(key)
+                    if current is None:
+                        current = self._sketches[key] = loaded[key]
+                    for metric, sketch in by_metric.items():
+                        if metric in current:
+                            current[metric].merge(sketch)
+                        else:
+                            current[metric] = sketch
+                    self._dirty.add(key)
+                break
+
+        with self._save_lock:
+            with self._lock:
+                saved = set(self._dirty)
+                rows = self._rows(self.writer_id, {key: self._sketches[key] for key in saved})
+                self._dirty.clear()
+            failed = self._persist(rows, concurrency)
+            today = date.today()
+            with self._lock:
+                self._dirty.update(failed)
+                for key in saved - failed:
+                    if key not in self._dirty and key[1] < today:
+                        # Persisted and not touched since: the row is as good as the sketch
+                        del self._sketches[key]
+                        self._evictions += 1
+            if failed:
+                print(f"Error saving {len(failed)} engagement sketches; retrying on the next update")
+
+    def _load_many(self, keys, concurrency=100):
+        # This writer's stored rows, which a previous process with the same id may have written
+        blobs = self.db.get_writer_engagement_sketches(
+            [(post_type, day, metric) for post_type, day in keys for metric in METRICS],
+            self.writer_id,
+            concurrency
+        )
+        loaded = {key: {} for key in keys}
+        for (post_type, day, metric), blob in blobs.items():
+            loaded[(post_type, day)][metric] = DDSketch.from_bytes(blob)
+        return loaded
+
+    def backfill(self, posts):
+        """Build sketches for existing posts under a fixed writer id.
+
+        The result is deterministic for a given set of posts, so workers that
+        race to backfill simply write identical rows.
+        """
+        failed = self._persist(self._rows("backfill", self._build(posts)))
+        if failed:
+            raise RuntimeError(f"Failed to save {len(failed)} backfilled engagement sketches")
+
+    def distribution(self, post_type, quantiles, start_date=None, end_date=None):
+        """Merge the stored sketches for a date range and report quantiles"""
+        merged = {metric: DDSketch() for metric in METRICS}
+        for row in self.db.get_engagement_sketches(post_type, start_date, end_date):
+            merged[row["metric"]].merge(DDSketch.from_bytes(row["sketch"]))
+
+        result = {}
+        for metric, sketch in merged.items():
+            values = sketch.quantiles(quantiles)
+            result[metric] = {
+                "count": sketch.count,
+                "mean": sketch.mean,
+                "min": sketch.min if sketch.count else None,
+                "max": sketch.max if sketch.count else None,
+                "quantiles": {str(q): v for q, v in zip(quantiles, values)}
+            }
+        return result
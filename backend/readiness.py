@@ -0,0 +1,75 @@
+import json
+import time
+
+# Paths served while the service is still starting
+EXEMPT_PATHS = {"/", "/ready", "/metrics", "/favicon.ico"}
+
+
+class Readiness:
+    """Tracks the background initialization task started at boot"""
+
+    def __init__(self):
+        self.task = None
+        self.started_at = None
+        self.ready_at = None
+
+    def start(self, task):
+        self.task = task
+        self.started_at = time.perf_counter()
+        task.add_done_callback(self._done)
+
+    def _done(self, task):
+        if not task.cancelled() and task.exception() is None:
+            self.ready_at = time.perf_counter()
+
+    @property
+    def ready(self):
+        if self.ready_at is None and self.task is not None and self.task.done():
+            # The done callback may not have run yet
+            self._done(self.task)
+        return self.ready_at is not None
+
+    async def wait(self):
+        """Wait for initialization to finish, ignoring its outcome"""
+        if self.task is not None and not self.task.done():
+            try:
+                await self.task
+            except Exception:
+                pass
+
+    def status(self):
+        if self.ready:
+            return {"status": "ready", "startup_seconds": self.ready_at - self.started_at}
+        if self.task is not None and self.task.done():
+            error = "cancelled" if self.task.cancelled() else str(self.task.exception())
+            return {"status": "failed", "error": error}
+        return {"status": "starting"}
+
+
+class ReadinessMiddleware:
+    """ASGI middleware answering 503 for API routes until the service is ready"""
+
+    def __init__(self, app, readiness):
+        self.app = app
+        self.readiness = readiness
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or self.readiness.ready
+            or scope["path"] in EXEMPT_PATHS
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        body = json.dumps({"detail": "Service is starting"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", b"1")
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
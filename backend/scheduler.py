@@ -0,0 +1,165 @@
+"""
+In-process scheduler for the background jobs that precompute reports.
+
+Every worker runs the same job loops on a jittered interval, but a run only
+happens on the worker holding the job's lease (a job_leases row that expires
+after one interval), so one worker in the cluster does the work per period.
+A run first gathers the job's inputs, which are cheap, and skips the
+expensive part (usually a Gemini call) when their hash matches the
+data_version of the stored report. Reports are persisted through the storage
+backend, so the other workers pick them up and serve them as they are.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import socket
+import time
+import uuid
+from datetime import datetime, timezone
+
+from starlette.concurrency import run_in_threadpool
+
+from metrics import JOB_DURATION, JOB_RUNS, JOB_LAST_SUCCESS
+
+# How often each report is recomputed (seconds)
+REPORT_REFRESH_SECONDS = float(os.getenv("REPORT_REFRESH_SECONDS", "900"))
+# Fraction of the interval each sleep is randomly stretched or shortened by
+JOB_JITTER = 0.1
+
+# Identifies this process as a lease holder
+OWNER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def data_version(inputs):
+    """Short hash of a job's inputs; the report is only recomputed when it changes"""
+    encoded = json.dumps(inputs, sort_keys=True, default=str).encode()
+    return hashlib.sha1(encoded).hexdigest()[:16]
+
+
+def _utcnow():
+    # Naive UTC, which is what the driver returns for timestamp columns
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class Job:
+    """A periodically recomputed report.
+
+    inputs() gathers the data the report depends on and compute(inputs)
+    builds the JSON-serializable result; both are coroutine functions.
+    """
+
+    def __init__(self, name, inputs, compute, interval=REPORT_REFRESH_SECONDS, jitter=JOB_JITTER):
+        self.name = name
+        self.inputs = inputs
+        self.compute = compute
+        self.interval = interval
+        self.jitter = jitter
+
+
+class Report:
+    """The stored result of a job run"""
+
+    def __init__(self, name, data_version, computed_at, result):
+        self.name = name
+        self.data_version = data_version
+        self.computed_at = computed_at
+        self.result = result
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row["name"], row["data_version"], row["computed_at"], json.loads(row["payload"]))
+
+
+class Scheduler:
+    """Runs the registered jobs in the background and keeps their latest reports"""
+
+    def __init__(self, store, owner=OWNER_ID):
+        self.store = store
+        self.owner = owner
+        self.jobs = {}
+        self.reports = {}
+        self._running = {}
+        self._tasks = []
+
+    def add(self, job):
+        self.jobs[job.name] = job
+        return job
+
+    def start(self):
+        """Start one loop per job on the running event loop"""
+        self._tasks = [asyncio.create_task(self._loop(job)) for job in self.jobs.values()]
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def latest(self, name, fresh=False):
+        """The latest report of a job; fresh=True (or no report yet) runs it now"""
+        if not fresh:
+            report = self.reports.get(name) or await self._load(name)
+            if report is not None:
+                return report
+        return await self.run(name, force=True)
+
+    async def run(self, name, force=False):
+        """Run a job now, sharing the run with callers that are already waiting for one"""
+        key = (name, force)
+        task = self._running.get(key)
+        if task is None:
+            task = self._running[key] = asyncio.ensure_future(self._run(self.jobs[name], force))
+            task.add_done_callback(lambda _: self._running.pop(key, None))
+        # A caller going away must not cancel the run for everyone else
+        return await asyncio.shield(task)
+
+    async def _run(self, job, force):
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            inputs = await job.inputs()
+            version = data_version(inputs)
+            if not force:
+                stored = await self._load(job.name)
+                if stored is not None and stored.data_version == version:
+                    outcome = "unchanged"
+                    JOB_LAST_SUCCESS.labels(job.name).set(time.time())
+                    return stored
+
+            payload = json.dumps(await job.compute(inputs), default=str)
+            report = Report(job.name, version, _utcnow(), json.loads(payload))
+            await run_in_threadpool(
+                self.store.save_report, job.name, version, report.computed_at, payload
+            )
+            self.reports[job.name] = report
+            outcome = "computed"
+            JOB_LAST_SUCCESS.labels(job.name).set(time.time())
+            return report
+        finally:
+            JOB_RUNS.labels(job.name, outcome).inc()
+            JOB_DURATION.labels(job.name).observe(time.perf_counter() - start)
+
+    async def _load(self, name):
+        """Pick up the stored report if it is newer than the one held here"""
+        row = await run_in_threadpool(self.store.get_report, name)
+        if row is None:
+            return None
+        current = self.reports.get(name)
+        if current is None or row["computed_at"] > current.computed_at:
+            current = self.reports[name] = Report.from_row(row)
+        return current
+
+    async def _loop(self, job):
+        # Spread the first runs out so workers started together don't all race for the lease
+        await asyncio.sleep(random.uniform(0, job.jitter * job.interval))
+        while True:
+            try:
+                if await run_in_threadpool(self.store.acquire_lease, job.name, self.owner, job.interval):
+                    await self.run(job.name)
+                else:
+                    JOB_RUNS.labels(job.name, "not_leader").inc()
+                    await self._load(job.name)
+            except Exception as e:
+                print(f"Error running job {job.name}: {str(e)}")
+            await asyncio.sleep(job.interval * random.uniform(1 - job.jitter, 1 + job.jitter))
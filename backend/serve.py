@@ -0,0 +1,32 @@
+"""
+Production entry point: serves the API from several worker processes.
+
+    cd backend
+    python serve.py --workers 4
+
+Uvicorn spawns each worker as a fresh interpreter, so every worker opens its
+own Cassandra session in the startup hook rather than inheriting one. Workers
+on the same host share the precomputed aggregates through a memory-mapped file
+(see shared_aggregates.py).
+"""
+import argparse
+import os
+
+import uvicorn
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument(
+        "--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        help="Number of worker processes (default: WEB_CONCURRENCY or the CPU count)"
+    )
+    args = parser.parse_args()
+
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import fcntl
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+from posts import POST_TYPES, type_index
+
+# File shared by every worker on the host; see SharedAggregates
+AGGREGATES_PATH = os.getenv("AGGREGATES_PATH", "shared_aggregates.bin")
+# How often the refreshing worker rebuilds the aggregates from storage (seconds)
+AGGREGATE_REFRESH_SECONDS = float(os.getenv("AGGREGATE_REFRESH_SECONDS", "30"))
+
+# Columns of the per (type, hour) cells
+COUNT, LIKES, SHARES, COMMENTS = range(4)
+N_TYPES = len(POST_TYPES) + 1
+
+_MAGIC = 0x41474731  # "AGG1"
+# Header: magic, sequence (odd while a write is in progress), generation, updated_at (ns)
+_HEADER_WORDS = 8
+_DATA_SHAPE = (N_TYPES, 24, 4)
+_FILE_SIZE = 8 * _HEADER_WORDS + 8 * int(np.prod(_DATA_SHAPE))
+# How long a reader waits for a write to finish before checking whether its writer died
+READ_TIMEOUT_SECONDS = 1.0
+
+
+def compute_cells(posts):
+    """Sum count/likes/shares/comments per (post type, hour of day)"""
+    type_idx = np.empty(len(posts), dtype=np.int64)
+    hours = np.empty(len(posts), dtype=np.int64)
+    values = np.empty((len(posts), 3))
+    for i, post in enumerate(posts):
+        timestamp = post["timestamp"]
+        if not isinstance(timestamp, datetime):
+            timestamp = datetime.fromisoformat(str(timestamp))
+        type_idx[i] = type_index(post["type"])
+        hours[i] = timestamp.hour
+        values[i] = (post["likes"] or 0, post["shares"] or 0, post["comments"] or 0)
+    return cells_from_columns(type_idx, hours, values[:, 0], values[:, 1], values[:, 2])
+
+
+def cells_from_columns(type_idx, hours, likes, shares, comments, weight=1):
+    """Vectorized compute_cells over column arrays; weight=-1 subtracts the rows"""
+    cells = np.zeros(_DATA_SHAPE)
+    flat = cells.reshape(N_TYPES * 24, 4)
+    index = np.asarray(type_idx, dtype=np.int64) * 24 + np.asarray(hours, dtype=np.int64)
+    flat[:, COUNT] = np.bincount(index, minlength=N_TYPES * 24) * weight
+    for column, values in ((LIKES, likes), (SHARES, shares), (COMMENTS, comments)):
+        flat[:, column] = np.bincount(index, weights=values, minlength=N_TYPES * 24) * weight
+    return cells
+
+
+def hourly_means(cells):
+    """Mean engagement per (post type, hour) for the post types that have posts"""
+    counts = cells[..., COUNT]
+    totals = cells[..., LIKES] + cells[..., SHARES] + cells[..., COMMENTS]
+    mean = np.divide(totals, counts, out=np.zeros_like(totals), where=counts > 0)
+    present = counts.sum(axis=1) > 0
+    names = POST_TYPES + ["other"]
+    return {names[i]: mean[i].tolist() for i in range(N_TYPES) if present[i]}
+
+
+class SharedAggregates:
+    """Per-type, per-hour engagement sums in a memory-mapped file.
+
+    Every worker maps the same file, so reads are served straight from the
+    shared page cache without copying. Writers serialize on an flock and
+    publish with a sequence lock: the sequence is odd while cells are being
+    written, and readers retry if it changed underneath them.
+    """
+
+    def __init__(self, path=AGGREGATES_PATH):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            if os.fstat(fd).st_size != _FILE_SIZE:
+                # New file or an older layout: start from zeroed cells
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, _FILE_SIZE)
+                os.pwrite(fd, np.array([_MAGIC], dtype=np.int64).tobytes(), 0)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+        self._header = np.memmap(path, dtype=np.int64, mode="r+", shape=(_HEADER_WORDS,))
+        self._cells = np.memmap(
+            path, dtype=np.float64, mode="r+", offset=8 * _HEADER_WORDS, shape=_DATA_SHAPE
+        )
+        self._write_lock = open(f"{path}.lock", "a")
+        self._refresh_lock = None
+        self._repair()
+
+    @property
+    def generation(self):
+        return int(self._header[2])
+
+    def _write(self, update, incremental=False):
+        fcntl.flock(self._write_lock, fcntl.LOCK_EX)
+        try:
+            if incremental and self._header[2] == 0:
+                # Nothing built (or a torn write was discarded): the next rebuild covers it
+                return
+            self._header[1] += 1
+            update(self._cells)
+            self._header[2] += 1
+            self._header[3] = time.time_ns()
+            self._header[1] += 1
+        finally:
+            fcntl.flock(self._write_lock, fcntl.LOCK_UN)
+
+    def _repair(self):
+        """Recover from a writer that died mid-write, leaving the sequence odd.
+
+        Holding the write lock means no write is in progress, so an odd
+        sequence can only be left over. The cells may be torn, so they are
+        marked unbuilt (generation 0) until the next publish.
+        Returns whether a repair was needed.
+        """
+        fcntl.flock(self._write_lock, fcntl.LOCK_EX)
+        try:
+            if int(self._header[1]) % 2 == 0:
+                return False
+            self._header[2] = 0
+            self._header[1] += 1
+            print("Shared aggregates were left mid-write; waiting for the next rebuild")
+            return True
+        finally:
+            fcntl.flock(self._write_lock, fcntl.LOCK_UN)
+
+    def publish(self, cells):
+        """Replace every cell (a full rebuild)"""
+        def update(target):
+            target[...] = cells
+        self._write(update)
+
+    def add_posts(self, posts):
+        """Fold newly saved posts into the shared cells"""
+        cells = compute_cells(posts)
+        def update(target):
+            target += cells
+        self._write(update, incremental=True)
+
+    def read(self, fn):
+        """Apply fn to a consistent read-only view of the cells, or return None if there is none"""
+        deadline = time.monotonic() + READ_TIMEOUT_SECONDS
+        while True:
+            seq = int(self._header[1])
+            if seq % 2 == 0:
+                result = fn(self._cells)
+                if int(self._header[1]) == seq:
+                    return result
+            if time.monotonic() > deadline:
+                # Either a writer died mid-write or this worker is starved; both
+                # cases let the caller fall back rather than spin forever
+                self._repair()
+                return None
+            time.sleep(0)
+
+    def type_averages(self, post_type):
+        """Average likes/shares/comments for a post type.
+
+        Returns None if the cells aren't built, or for a type outside
+        POST_TYPES: those all share the "other" row, which holds no single
+        type's numbers.
+        """
+        if self.generation == 0 or post_type not in POST_TYPES:
+            return None
+        i = type_index(post_type)
+
+        def averages(cells):
+            totals = cells[i].sum(axis=0)
+            count = totals[COUNT]
+            if count == 0:
+                return {"count": 0, "likes": 0, "shares": 0, "comments": 0}
+            return {
+                "count": int(count),
+                "likes": float(totals[LIKES] / count),
+                "shares": float(totals[SHARES] / count),
+                "comments": float(totals[COMMENTS] / count)
+            }
+        return self.read(averages)
+
+    def hourly_engagement(self):
+        """Mean engagement per (post type, hour) for types that have posts, or None if not built"""
+        if self.generation == 0:
+            return None
+        return self.read(hourly_means)
+
+    @property
+    def is_refresher(self):
+        """Whether this worker holds the host-wide refresher role"""
+        return self._refresh_lock is not None
+
+    def try_become_refresher(self):
+        """Take the host-wide refresher role if no other live worker holds it"""
+        if self.is_refresher:
+            return True
+        lock = open(f"{self.path}.refresh", "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return False
+        # Held until this process exits, when the OS releases it for another worker
+        self._refresh_lock = lock
+        return True
@@ -0,0 +1,214 @@
+import math
+import os
+import threading
+import time
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from db_config import CHANGE_LOG_TTL_SECONDS
+from posts import POST_TYPES, signed_hash, tokenize, type_index
+from snapshot import REPLAY_MARGIN_MS
+
+# Width of the hashed TF-IDF vectors; the search cost is linear in it
+SIMILARITY_DIM = int(os.getenv("SIMILARITY_DIM", "128"))
+SIMILARITY_INDEX_PATH = os.getenv("SIMILARITY_INDEX_PATH", "similarity_index.npz")
+
+_INITIAL_CAPACITY = 1024
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def _content_hash(post):
+    # Engagement updates log a post as changed too; this tells whether its vector would change
+    return zlib.crc32(f"{post['type']}\0{post['content'] or ''}".encode("utf-8"))
+
+
+class SimilarityIndex:
+    """Nearest posts by content, over hashed TF-IDF vectors in one NumPy matrix.
+
+    Each post's tokens are weighted by (1 + log tf) * idf and signed-hashed
+    into SIMILARITY_DIM buckets, then L2-normalized, so a search is a single
+    matrix-vector product followed by a top-k partition. Vectors keep the
+    idf from when they were added; fit() reweights everything. Like the
+    snapshot, the index records a high-water mark and catches up on other
+    workers' writes from the post_changes log. Only the worker that refreshes
+    the shared aggregates saves the index; the others reload its file.
+    """
+
+    def __init__(self, dim=SIMILARITY_DIM, path=SIMILARITY_INDEX_PATH):
+        self.dim = dim
+        self.path = path
+        self._lock = threading.Lock()
+        self._loaded_mtime = None
+        self._reset()
+
+    def _reset(self):
+        self.vectors = np.zeros((_INITIAL_CAPACITY, self.dim), dtype=np.float32)
+        self.types = np.zeros(_INITIAL_CAPACITY, dtype=np.int8)
+        self.hashes = np.zeros(_INITIAL_CAPACITY, dtype=np.uint32)
+        self.ids = []
+        self._rows = {}
+        self._df = Counter()
+        self.high_water_mark = None
+        # Whether any vector changed since the index was last saved or loaded
+        self.unsaved = False
+
+    def __len__(self):
+        return len(self.ids)
+
+    def is_stale(self):
+        """Whether the change log no longer covers everything since the high-water mark"""
+        if self.high_water_mark is None:
+            return True
+        return (_now_ms() - self.high_water_mark) / 1000 >= CHANGE_LOG_TTL_SECONDS - 3600
+
+    def _idf(self, token):
+        return math.log((1 + len(self.ids)) / (1 + self._df[token])) + 1
+
+    def vectorize(self, content):
+        """Unit-length hashed TF-IDF vector of a text (all zeros if it has no tokens)"""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token, tf in Counter(tokenize(content)).items():
+            bucket, sign = signed_hash(token, self.dim)
+            vector[bucket] += sign * (1 + math.log(tf)) * self._idf(token)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _grow(self, size):
+        capacity = len(self.types)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:len(self.vectors)] = self.vectors
+        types = np.zeros(capacity, dtype=np.int8)
+        types[:len(self.types)] = self.types
+        hashes = np.zeros(capacity, dtype=np.uint32)
+        hashes[:len(self.hashes)] = self.hashes
+        self.vectors, self.types, self.hashes = vectors, types, hashes
+
+    def add(self, posts):
+        """Add posts, or replace the vectors of indexed posts whose content or type changed"""
+        with self._lock:
+            changed = []
+            for post in posts:
+                content_hash = _content_hash(post)
+                row = self._rows.get(post["id"])
+                if row is None or self.hashes[row] != content_hash:
+                    changed.append((post, content_hash))
+            if not changed:
+                return
+            # Count document frequencies first so a batch is weighted as a whole
+            for post, _ in changed:
+                if post["id"] not in self._rows:
+                    self._df.update(set(tokenize(post["content"])))
+                    self._rows[post["id"]] = len(self.ids)
+                    self.ids.append(post["id"])
+            self._grow(len(self.ids))
+            for post, content_hash in changed:
+                row = self._rows[post["id"]]
+                self.vectors[row] = self.vectorize(post["content"])
+                self.types[row] = type_index(post["type"])
+                self.hashes[row] = content_hash
+            self.unsaved = True
+
+    def fit(self, posts):
+        """Build the index from scratch"""
+        high_water_mark = _now_ms()
+        with self._lock:
+            self._reset()
+        self.add(posts)
+        self.high_water_mark = high_water_mark
+
+    def catch_up(self, db):
+        """Add the posts changed since the high-water mark (including other workers' writes)"""
+        high_water_mark = _now_ms()
+        post_ids = db.get_changed_post_ids(self.high_water_mark - REPLAY_MARGIN_MS)
+        if post_ids:
+            self.add(db.get_posts(sorted(post_ids)))
+        self.high_water_mark = high_water_mark
+
+    def search(self, content, k=10, post_type=None, exclude=None):
+        """Up to k (post_id, cosine similarity) pairs, most similar first"""
+        query = self.vectorize(content)
+        with self._lock:
+            n = len(self.ids)
+            vectors, types, ids = self.vectors[:n], self.types[:n], self.ids
+            exclude_row = self._rows.get(exclude)
+        if n == 0 or k <= 0 or not query.any():
+            return []
+
+        scores = vectors @ query
+        if post_type is not None:
+            scores[types != type_index(post_type)] = -np.inf
+        if exclude_row is not None:
+            scores[exclude_row] = -np.inf
+
+        k = min(k, n)
+        top = np.argpartition(scores, n - k)[n - k:]
+        top = top[np.argsort(-scores[top])]
+        return [(ids[row], float(scores[row])) for row in top if scores[row] > 0]
+
+    def save(self, path=None):
+        """Persist the vectors, ids and document frequencies"""
+        path = path or self.path
+        with self._lock:
+            n = len(self.ids)
+            # Workers share the path, so each stages its own file
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    dim=self.dim,
+                    post_types=np.array(POST_TYPES),
+                    high_water_mark=self.high_water_mark or 0,
+                    vectors=self.vectors[:n],
+                    types=self.types[:n],
+                    hashes=self.hashes[:n],
+                    ids=np.array(self.ids, dtype=str),
+                    df_tokens=np.array(list(self._df), dtype=str),
+                    df_counts=np.fromiter(self._df.values(), dtype=np.int64, count=len(self._df))
+                )
+            os.replace(tmp_path, path)
+            self._loaded_mtime = os.stat(path).st_mtime_ns
+            self.unsaved = False
+
+    def load(self, path=None):
+        """Load a persisted index; returns False if none is usable"""
+        path = path or self.path
+        if not os.path.exists(path):
+            return False
+        with np.load(path) as data:
+            if (int(data["dim"]) != self.dim or list(data["post_types"]) != POST_TYPES
+                    or "hashes" not in data):
+                return False
+            with self._lock:
+                self._loaded_mtime = os.stat(path).st_mtime_ns
+                self.ids = data["ids"].tolist()
+                self._rows = {post_id: row for row, post_id in enumerate(self.ids)}
+                self._df = Counter(dict(zip(data["df_tokens"].tolist(), data["df_counts"].tolist())))
+                self.vectors = np.zeros((max(len(self.ids), _INITIAL_CAPACITY), self.dim), dtype=np.float32)
+                self.vectors[:len(self.ids)] = data["vectors"]
+                self.types = np.zeros(len(self.vectors), dtype=np.int8)
+                self.types[:len(self.ids)] = data["types"]
+                self.hashes = np.zeros(len(self.vectors), dtype=np.uint32)
+                self.hashes[:len(self.ids)] = data["hashes"]
+                self.high_water_mark = int(data["high_water_mark"])
+                self.unsaved = False
+        return True
+
+    def reload(self, path=None):
+        """Load the index file if it was saved since this worker last read or wrote it"""
+        path = path or self.path
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self._loaded_mtime:
+            return False
+        return self.load(path)
@@ -0,0 +1,230 @@
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from db_config import CHANGE_LOG_TTL_SECONDS
+from posts import POST_TYPES, type_index
+from shared_aggregates import cells_from_columns
+
+# Directory holding the snapshot versions and the CURRENT pointer
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+# How often the refreshing worker writes a new snapshot (seconds)
+SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("SNAPSHOT_INTERVAL_SECONDS", "3600"))
+
+# Bump when the column layout changes; snapshots of another version are rebuilt
+FORMAT_VERSION = 1
+COLUMNS = ("type", "hour", "timestamp", "likes", "shares", "comments")
+# Changes are replayed from this long before the high-water mark to cover clock skew between writers
+REPLAY_MARGIN_MS = 60 * 1000
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def post_columns(posts, sort=True):
+    """Column arrays for a list of post rows, sorted by post id unless sort is False"""
+    if sort:
+        posts = sorted(posts, key=lambda post: post["id"])
+    timestamps = []
+    for post in posts:
+        timestamp = post["timestamp"]
+        if not isinstance(timestamp, datetime):
+            timestamp = datetime.fromisoformat(str(timestamp))
+        timestamps.append(timestamp.replace(tzinfo=None))
+    timestamp_ms = np.array(timestamps, dtype="datetime64[ms]").astype(np.int64)
+
+    ids = np.array([post["id"].encode() for post in posts])
+    if len(ids) == 0:
+        ids = ids.astype("S1")
+    return {
+        "id": ids,
+        "type": np.array([type_index(post["type"]) for post in posts], dtype=np.int8),
+        "hour": ((timestamp_ms // 3600000) % 24).astype(np.int8),
+        "timestamp": timestamp_ms,
+        "likes": np.array([post["likes"] or 0 for post in posts], dtype=np.int64),
+        "shares": np.array([post["shares"] or 0 for post in posts], dtype=np.int64),
+        "comments": np.array([post["comments"] or 0 for post in posts], dtype=np.int64)
+    }
+
+
+def _cells(columns, rows=slice(None), weight=1):
+    return cells_from_columns(
+        columns["type"][rows], columns["hour"][rows],
+        columns["likes"][rows], columns["shares"][rows], columns["comments"][rows],
+        weight
+    )
+
+
+class Snapshot:
+    """Columnar dump of the posts table as .npy files, opened with mmap.
+
+    Columns are sorted by post id so a post can be found with a binary search
+    over the id column. The manifest records the high-water mark: the time the
+    scan started. Anything changed since then is replayed from post_changes.
+    Files are only read after they are written, so every worker mapping a
+    snapshot shares its pages through the page cache.
+
+    catch_up() reads the change log from a cursor it advances each time, and
+    keeps the latest row of each changed post along with the cell delta they
+    make, so a refresh only fetches what changed since the previous one.
+    """
+
+    def __init__(self, path, manifest, columns, cells):
+        self.path = path
+        self.manifest = manifest
+        self.columns = columns
+        self.cells = cells
+        self._lock = threading.Lock()
+        self._cursor = manifest["high_water_mark"] - REPLAY_MARGIN_MS
+        self._changed = {}
+        self._delta = np.zeros_like(cells)
+
+    @property
+    def high_water_mark(self):
+        return self.manifest["high_water_mark"]
+
+    def __len__(self):
+        return len(self.columns["id"])
+
+    def is_stale(self):
+        """Whether a new snapshot is due (or the change log no longer covers this one)"""
+        age = (_now_ms() - self.high_water_mark) / 1000
+        return age >= min(SNAPSHOT_INTERVAL_SECONDS, CHANGE_LOG_TTL_SECONDS - 3600)
+
+    @classmethod
+    def load(cls, directory=SNAPSHOT_DIR, current=None):
+        """Map the current snapshot (reusing current if it is still the one), or return None"""
+        try:
+            with open(os.path.join(directory, "CURRENT")) as f:
+                path = os.path.join(directory, f.read().strip())
+            if current is not None and current.path == path:
+                return current
+            with open(os.path.join(path, "manifest.json")) as f:
+                manifest = json.load(f)
+            if manifest.get("format_version") != FORMAT_VERSION:
+                return None
+            columns = {
+                name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+                for name in ("id",) + COLUMNS
+            }
+            cells = np.load(os.path.join(path, "cells.npy"))
+        except (OSError, ValueError):
+            # Missing, partially written or replaced while we were opening it
+            return current
+        return cls(path, manifest, columns, cells)
+
+    @classmethod
+    def write(cls, db, directory=SNAPSHOT_DIR, high_water_mark=None, on_page=None):
+        """Scan the posts table into a new snapshot and make it current.
+
+        The scan is read a page at a time and only the columns are kept. A
+        caller that needs the scan too can pass on_page, which is called with
+        each page, along with the time the scan started as high_water_mark.
+        """
+        if high_water_mark is None:
+            high_water_mark = _now_ms()
+        pages = []
+        for page in db.scan_posts():
+            if on_page is not None:
+                on_page(page)
+            pages.append(post_columns(page, sort=False))
+        if pages:
+            columns = {name: np.concatenate([page[name] for page in pages]) for name in pages[0]}
+        else:
+            columns = post_columns([])
+        order = np.argsort(columns["id"], kind="stable")
+        columns = {name: values[order] for name, values in columns.items()}
+        manifest = {
+            "format_version": FORMAT_VERSION,
+            "high_water_mark": high_water_mark,
+            "created_at": _now_ms(),
+            "post_types": POST_TYPES,
+            "rows": len(columns["id"])
+        }
+
+        os.makedirs(directory, exist_ok=True)
+        name = f"v{FORMAT_VERSION}-{high_water_mark}"
+        staging = os.path.join(directory, f".{name}.tmp")
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for column, values in columns.items():
+            np.save(os.path.join(staging, f"{column}.npy"), values)
+        np.save(os.path.join(staging, "cells.npy"), _cells(columns))
+        with open(os.path.join(staging, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+        os.rename(staging, os.path.join(directory, name))
+
+        pointer = os.path.join(directory, ".CURRENT.tmp")
+        with open(pointer, "w") as f:
+            f.write(name)
+        os.replace(pointer, os.path.join(directory, "CURRENT"))
+
+        # Workers still mapping an older snapshot keep reading it after the unlink
+        for entry in os.listdir(directory):
+            if entry.startswith("v") and entry != name:
+                shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+        print(f"Wrote analytics snapshot {name} ({manifest['rows']} posts)")
+        return cls.load(directory)
+
+    def lookup(self, post_ids):
+        """Row index of each post id in the snapshot, or -1 if it is not there"""
+        ids = self.columns["id"]
+        encoded = [post_id.encode() for post_id in post_ids]
+        # Longer ids would be truncated to the column width and could match by prefix
+        fits = np.array([len(key) <= ids.itemsize for key in encoded], dtype=bool)
+        keys = np.array(encoded, dtype=ids.dtype)
+        rows = np.searchsorted(ids, keys)
+        found = fits & (rows < len(ids))
+        found[found] = ids[rows[found]] == keys[found]
+        return np.where(found, rows, -1)
+
+    def catch_up(self, db):
+        """Fetch the posts changed since the last catch-up and fold them in; returns them"""
+        started = _now_ms()
+        with self._lock:
+            since = self._cursor
+        post_ids = db.get_changed_post_ids(since)
+        posts = db.get_posts(sorted(post_ids)) if post_ids else []
+        with self._lock:
+            if posts:
+                previous = [self._changed[post["id"]] for post in posts if post["id"] in self._changed]
+                rows = self.lookup([post["id"] for post in posts if post["id"] not in self._changed])
+                # Each post's last counted row comes out and its current row goes in
+                self._delta += _cells(self.columns, rows[rows >= 0], weight=-1)
+                if previous:
+                    self._delta += _cells(post_columns(previous), weight=-1)
+                self._delta += _cells(post_columns(posts))
+                self._changed.update((post["id"], post) for post in posts)
+            # Changes are logged with the writer's clock, so keep re-reading a margin before now
+            self._cursor = max(self._cursor, started - REPLAY_MARGIN_MS)
+        return posts
+
+    def changes(self):
+        """Current rows of the posts changed since the high-water mark, as of the last catch-up"""
+        with self._lock:
+            return list(self._changed.values())
+
+    def replay(self):
+        """Per (type, hour) cells with changed posts replacing their snapshot rows"""
+        with self._lock:
+            return self.cells + self._delta
+
+    def current_columns(self):
+        """Snapshot columns with changed posts replacing their snapshot rows"""
+        changed_posts = self.changes()
+        if not changed_posts:
+            return self.columns
+        changed = post_columns(changed_posts)
+        rows = self.lookup([post["id"] for post in changed_posts])
+        keep = np.ones(len(self), dtype=bool)
+        keep[rows[rows >= 0]] = False
+        return {
+            name: np.concatenate([self.columns[name][keep], changed[name]])
+            for name in COLUMNS
+        }
@@ -0,0 +1,154 @@
+import os
+from abc import ABC, abstractmethod
+
+
+class StorageBackend(ABC):
+    """Interface shared by DataStaxService and its in-memory stand-in.
+
+    Posts are returned as PostRecords and other rows as dicts (the driver's
+    dict_factory shape), timestamps as datetime and dates as date, so callers
+    can't tell the backends apart.
+    Every backend also exposes a `reach` attribute (EngagementReach).
+    """
+
+    # Posts
+    @abstractmethod
+    def save_post(self, post_data):
+        ...
+
+    @abstractmethod
+    def get_post(self, post_id):
+        ...
+
+    @abstractmethod
+    def get_all_posts(self):
+        ...
+
+    @abstractmethod
+    def scan_posts(self, page_size=5000):
+        ...
+
+    @abstractmethod
+    def get_posts_by_type(self, post_type):
+        ...
+
+    @abstractmethod
+    def get_posts_page(self, limit, cursor=None, post_type=None, start=None, end=None,
+                       min_engagement=None, fields=None):
+        ...
+
+    @abstractmethod
+    def get_post_type(self, post_id):
+        ...
+
+    @abstractmethod
+    def get_post_types(self, post_ids, concurrency=100):
+        ...
+
+    @abstractmethod
+    def get_posts(self, post_ids, concurrency=100):
+        ...
+
+    @abstractmethod
+    def get_changed_post_ids(self, since, concurrency=100):
+        ...
+
+    # Analytics and rollups
+    @abstractmethod
+    def save_analytics(self, post_id, engagement_count, sentiment_score):
+        ...
+
+    @abstractmethod
+    def get_performance_by_type(self, post_type, start_date, end_date):
+        ...
+
+    @abstractmethod
+    def get_engagement_trends(self):
+        ...
+
+    @abstractmethod
+    def update_content_performance(self, post_type, engagement_delta, sentiment_score):
+        ...
+
+    @abstractmethod
+    def get_analytics_dataframe(self, start_date, end_date):
+        ...
+
+    # User engagement
+    @abstractmethod
+    def save_user_engagement(self, user_id, post_id, engagement_type, timestamp=None):
+        ...
+
+    @abstractmethod
+    def save_user_engagements(self, events, concurrency=100):
+        ...
+
+    @abstractmethod
+    def add_post_engagement(self, deltas, concurrency=100):
+        ...
+
+    @abstractmethod
+    def add_content_performance(self, deltas, concurrency=100):
+        ...
+
+    @abstractmethod
+    def get_user_engagement_history(self, user_id, limit=100):
+        ...
+
+    # Sketches
+    @abstractmethod
+    def save_engagement_sketches(self, rows, concurrency=100):
+        ...
+
+    @abstractmethod
+    def get_writer_engagement_sketches(self, keys, writer_id, concurrency=100):
+        ...
+
+    @abstractmethod
+    def get_engagement_sketches(self, post_type, start_date=None, end_date=None):
+        ...
+
+    @abstractmethod
+    def has_engagement_sketches(self):
+        ...
+
+    @abstractmethod
+    def save_reach_sketches(self, rows, concurrency=100):
+        ...
+
+    @abstractmethod
+    def get_writer_reach_sketches(self, keys, writer_id, concurrency=100):
+        ...
+
+    @abstractmethod
+    def get_reach_sketches(self, scope, key, start_date=None, end_date=None):
+        ...
+
+    # Background jobs
+    @abstractmethod
+    def acquire_lease(self, name, owner, ttl_seconds):
+        ...
+
+    @abstractmethod
+    def save_report(self, name, data_version, computed_at, payload):
+        ...
+
+    @abstractmethod
+    def get_report(self, name):
+        ...
+
+    @abstractmethod
+    def close(self):
+        ...
+
+
+def create_storage(backend=None):
+    """Create the configured storage backend (STORAGE_BACKEND: "datastax" or "memory")"""
+    backend = backend or os.getenv("STORAGE_BACKEND", "datastax")
+    if backend == "memory":
+        from memory_service import InMemoryService
+        return InMemoryService()
+    if backend == "datastax":
+        from datastax_service import DataStaxService
+        return DataStaxService()
+    raise ValueError(f"Unknown storage backend: {backend}")
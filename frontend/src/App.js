@@ -46,49 +46,46 @@ function App() {
   const [timeAnalytics, setTimeAnalytics] = useState([]);
   const [trendingHashtags, setTrendingHashtags] = useState([]);
   const [activeTab, setActiveTab] = useState(0);
+  const [narratives, setNarratives] = useState({});
 
   useEffect(() => {
-    const fetchData = async () => {
-      try {
-        const [postsRes, timeRes, hashtagsRes] = await Promise.all([
-          axios.get(`${API_BASE_URL}/posts`),
-          axios.get(`${API_BASE_URL}/time-analytics`),
-          axios.get(`${API_BASE_URL}/trending-hashtags`)
-        ]);
-        setPosts(postsRes.data);
-        setTimeAnalytics(timeRes.data);
-        setTrendingHashtags(hashtagsRes.data);
-      } catch (error) {
-        console.error('Error fetching data:', error);
-        setError('Failed to fetch data. Please try again later.');
-      }
-    };
-
-    fetchData();
-  }, []);
-
-  useEffect(() => {
-    const fetchAnalyticsAndInsights = async () => {
+    const fetchDashboard = async () => {
       setLoading(true);
       setError(null);
       try {
-        const [analyticsRes, insightsRes] = await Promise.all([
-          axios.get(`${API_BASE_URL}/analytics/${postType}`),
-          axios.get(`${API_BASE_URL}/insights/${postType}`)
-        ]);
-        setAnalytics(analyticsRes.data);
-        setInsights(insightsRes.data.insights);
+        const { data } = await axios.get(`${API_BASE_URL}/dashboard`, {
+          params: { post_type: postType, include_figures: false }
+        });
+        setAnalytics(data.analytics[postType]);
+        setInsights(data.insights);
+        setPosts(data.posts);
+        setTimeAnalytics(data.time_analytics);
+        setTrendingHashtags(data.trending_hashtags);
       } catch (error) {
-        console.error('Error fetching analytics:', error);
-        setError('Failed to fetch analytics. Please try again later.');
+        console.error('Error fetching dashboard:', error);
+        setError('Failed to fetch data. Please try again later.');
       } finally {
         setLoading(false);
       }
     };
 
-    fetchAnalyticsAndInsights();
+    fetchDashboard();
   }, [postType]);
 
+  useEffect(() => {
+    // AI narratives arrive after the numbers; only stream the one this page shows
+    const source = new EventSource(`${API_BASE_URL}/dashboard/narratives?names=performance_analysis`);
+    source.addEventListener('performance_analysis', (event) => {
+      const { text } = JSON.parse(event.data);
+      if (text) {
+        setNarratives((current) => ({ ...current, performance_analysis: text }));
+      }
+    });
+    source.addEventListener('done', () => source.close());
+    source.onerror = () => source.close();
+    return () => source.close();
+  }, []);
+
   const handleTabChange = (event, newValue) => {
     setActiveTab(newValue);
   };
@@ -191,6 +188,21 @@ function App() {
               </Card>
             </Grid>
 
+            {narratives.performance_analysis && (
+              <Grid item xs={12}>
+                <Card>
+                  <CardContent>
+                    <Typography variant="h6" gutterBottom>
+                      AI Performance Analysis
+                    </Typography>
+                    <Typography variant="body2" component="p" sx={{ whiteSpace: 'pre-wrap' }}>
+                      {narratives.performance_analysis}
+                    </Typography>
+                  </CardContent>
+                </Card>
+              </Grid>
+            )}
+
             <Grid item xs={12}>
               <Card>
                 <CardContent>
@@ -198,7 +210,7 @@ function App() {
                     Recent Posts
                   </Typography>
                   <Grid container spacing={2}>
-                    {posts.filter(post => post.type === postType).map((post) => (
+                    {posts.map((post) => (
                       <Grid item xs={12} sm={6} md={4} key={post.id}>
                         <Card variant="outlined">
                           <CardContent>